@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class BlogappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blogapp'
+
+    def ready(self):
+        from mysite.changes import register_change_stamp
+        from .models import Article, Author, Category, Tag
+
+        for model in (Article, Author, Category, Tag, Article.tags.through):
+            register_change_stamp(model)
@@ -1,4 +1,6 @@
 from django.contrib.sitemaps import Sitemap
+from django.db.models import Max
+from django.urls import reverse
 
 from .models import Article
 
@@ -6,9 +8,21 @@ from .models import Article
 class BlogSitemap(Sitemap):
     changefreq = "never"
     priority = 0.5
+
     def items(self):
-        return Article.objects.filter(pub_date__isnull=False).order_by('-pub_date')
+        return (
+            Article.objects
+            .filter(pub_date__isnull=False)
+            # pub_date проставляется при создании, порядок pk тот же, но без сортировки
+            .order_by('-pk')
+            .values_list("pk", "updated_at")
+        )
+
+    def location(self, item) -> str:
+        return reverse('blogapp:article_details', kwargs={'pk': item[0]})
 
-    def lastmod(self, obj:Article):
-        return obj.pub_date
+    def lastmod(self, item):
+        return item[1]
 
+    def get_latest_lastmod(self):
+        return Article.objects.aggregate(latest=Max("updated_at"))["latest"]
@@ -1,3 +1,75 @@
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from blogapp.models import Article, Author, Category, Tag
+from requestdataapp.queries import QueryCountTestMixin
+
+
+class BlogQueryCountTestCase(QueryCountTestMixin, TestCase):
+    query_counts = {
+        "blogapp:article_list": 2,
+        ("blogapp:article_details", 1): 3,  # + updated_at для условного GET
+        "blogapp:article_feed": 1,
+    }
+
+
+class ConditionalGetTestCase(TestCase):
+
+    def setUp(self):
+        self.article = Article.objects.create(
+            title="Conditional",
+            content="text",
+            author=Author.objects.create(name="author"),
+            category=Category.objects.create(name="category"),
+        )
+
+    def get(self, url, **extra):
+        return self.client.get(url, HTTP_USER_AGENT="Mozilla/5.0", **extra)
+
+    def test_article_details(self):
+        url = reverse("blogapp:article_details", kwargs={"pk": self.article.pk})
+        response = self.get(url)
+        with self.assertTemplateNotUsed("blogapp/article_details.html"):
+            self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        self.article.title = "Changed"
+        self.article.save()
+        self.assertContains(self.get(url, HTTP_IF_NONE_MATCH=response["ETag"]), "Changed")
+
+    def test_article_details_follow_related_rows(self):
+        url = reverse("blogapp:article_details", kwargs={"pk": self.article.pk})
+        tag = Tag.objects.create(name="tag")
+        author, category = self.article.author, self.article.category
+
+        def rename_author():
+            author.name = "Renamed author"
+            author.save()
+
+        def rename_category():
+            category.name = "Renamed category"
+            category.save()
+
+        def rename_tag():
+            tag.name = "Renamed tag"
+            tag.save()
+
+        for change, text in [
+            (lambda: self.article.tags.add(tag), "tag"),
+            (rename_author, "Renamed author"),
+            (rename_category, "Renamed category"),
+            (rename_tag, "Renamed tag"),
+        ]:
+            etag = self.get(url)["ETag"]
+            change()
+            with self.subTest(text=text):
+                self.assertContains(self.get(url, HTTP_IF_NONE_MATCH=etag), text)
+
+    def test_articles_feed(self):
+        url = reverse("blogapp:article_feed")
+        response = self.get(url)
+        with self.assertNumQueries(0):
+            again = self.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(again.status_code, 304)
+
+        self.article.delete()
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
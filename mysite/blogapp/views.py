@@ -1,10 +1,13 @@
-from django.contrib.gis.feeds import Feed
 from django.shortcuts import render
 from django.urls import reverse_lazy, reverse
+from django.utils.decorators import method_decorator
 
 from django.views.generic import ListView, DetailView
 
-from .models import Article
+from mysite.changes import conditional_on, get_change_stamp, stamp_datetime
+from mysite.feeds import AsyncFeed
+
+from .models import Article, Author, Category, Tag
 
 
 class ArticlesListView(ListView):
@@ -17,6 +20,19 @@ class ArticlesListView(ListView):
     )
 
 
+# страница статьи показывает и эти таблицы: их изменения тоже меняют ответ
+ARTICLE_RELATED_MODELS = (Author, Category, Tag, Article.tags.through)
+
+
+def article_updated_at(request, pk, **kwargs):
+    updated_at = Article.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
+    if updated_at is None:
+        return None
+    related_stamp = max(get_change_stamp(model) for model in ARTICLE_RELATED_MODELS)
+    return max(updated_at, stamp_datetime(related_stamp))
+
+
+@method_decorator(conditional_on(article_updated_at), name="dispatch")
 class ArticleDetailView(DetailView):
     template_name = 'blogapp/article_details.html'
     queryset = (
@@ -26,7 +42,8 @@ class ArticleDetailView(DetailView):
     )
 
 
-class LatestArticlesFeed(Feed):
+class LatestArticlesFeed(AsyncFeed):
+    changes_model = Article
     title = "Blog articles (latest)"
     description = "Updates on changes in blog articles."
     link = reverse_lazy('blogapp:article_list')
@@ -0,0 +1,39 @@
+"""
+Настройки gunicorn, читаются из текущего каталога при запуске `gunicorn`.
+
+По умолчанию синхронные воркеры с mysite.wsgi. С DJANGO_ASGI=1 воркеры
+uvicorn обслуживают mysite.asgi: асинхронные представления (выгрузки,
+ленты) ждут БД и медленных клиентов без отдельного потока на запрос.
+Для этого все middleware проекта умеют работать асинхронно; синхронный
+DebugToolbarMiddleware (при DEBUG) снова уводит каждый запрос в поток.
+
+Хуки убирают снимки метрик (requestdataapp.metrics) прошлого запуска и
+завершившихся воркеров, чтобы /metrics не складывал их счётчики.
+"""
+import os
+from pathlib import Path
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "1"))
+
+if os.getenv("DJANGO_ASGI") == "1":
+    wsgi_app = "mysite.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "mysite.wsgi:application"
+
+
+def _metrics_dir() -> Path:
+    # хуки работают в мастере, где Django не запущен: нужны только настройки
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+    from django.conf import settings
+    return Path(settings.METRICS_DIR)
+
+
+def on_starting(server):
+    for path in _metrics_dir().glob("metrics-*.json"):
+        path.unlink(missing_ok=True)
+
+
+def child_exit(server, worker):
+    (_metrics_dir() / f"metrics-{worker.pid}.json").unlink(missing_ok=True)
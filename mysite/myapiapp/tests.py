@@ -1,3 +1,15 @@
+from django.contrib.auth.models import Group
 from django.test import TestCase
 
-# Create your tests here.
+from requestdataapp.queries import QueryCountTestMixin
+
+
+class ApiQueryCountTestCase(QueryCountTestMixin, TestCase):
+    query_counts = {
+        "myapiapp:groups": 4,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Group.objects.bulk_create([Group(name=f"group{i}") for i in range(5)])
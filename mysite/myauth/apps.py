@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MyauthConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myauth'
+
+    def ready(self):
+        from mysite.images import register_image_field
+        from .models import Profile
+
+        register_image_field(Profile, "avatar")
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:27
+
+import posixpath
+
+from django.db import migrations, models
+
+
+def record_variants(apps, schema_editor):
+    # варианты пишутся все сразу, достаточно проверить avatar.thumb.jpg
+    Profile = apps.get_model("myauth", "Profile")
+    storage = Profile._meta.get_field("avatar").storage
+    for pk, name in Profile.objects.exclude(avatar="").exclude(avatar__isnull=True).values_list("pk", "avatar"):
+        if storage.exists(posixpath.splitext(name)[0] + ".thumb.jpg"):
+            Profile.objects.filter(pk=pk).update(avatar_variants_for=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myauth', '0002_profile_avatar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_variants_for',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(record_variants, migrations.RunPython.noop),
+    ]
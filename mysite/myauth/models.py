@@ -14,6 +14,8 @@ class Profile(models.Model):
     bio = models.TextField(max_length=500, blank=True)
     agreement_accepted = models.BooleanField(default=False)
     avatar = models.ImageField(null=True, blank=True, upload_to=profile_avatar_directory_path)
+    # имя файла avatar, для которого построены варианты (mysite.images)
+    avatar_variants_for = models.CharField(max_length=100, blank=True, default="", editable=False)
 
 
 
@@ -1,3 +1,17 @@
 from django.test import TestCase
 
-# Create your tests here.
+from requestdataapp.queries import QueryCountTestMixin
+
+
+class AuthQueryCountTestCase(QueryCountTestMixin, TestCase):
+    query_counts = {
+        "myauth:login": 2,
+        "myauth:about-me": 3,
+        "myauth:user_list": 1,
+        ("myauth:user_detail", 1): 4,
+        ("myauth:user_update", 1): 4,
+        "myauth:register": 0,
+        "myauth:cookie_get": 0,
+        "myauth:session_get": 2,
+        "myauth:hello": 0,
+    }
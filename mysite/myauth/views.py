@@ -80,7 +80,7 @@ def login_view(request: HttpRequest) -> HttpResponse:
 
 
 class UsersListView(ListView):
-    model = User
+    queryset = User.objects.select_related("profile")
     template_name = 'myauth/user-list.html'
     context_object_name = 'users'
 
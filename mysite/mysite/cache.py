@@ -0,0 +1,567 @@
+"""
+Двухуровневый кэш: ограниченный LRU в памяти процесса (L1) перед общим
+для всех воркеров бэкендом (L2, например FileBasedCache).
+
+Горячие ключи читаются из памяти без открытия файла и unpickle с диска.
+Записи идут сквозь L1 в L2. В L1 значения живут не дольше L1_TIMEOUT и не
+дольше, чем осталось жить записи в L2 (срок хранится рядом со значением),
+поэтому обычный set() в другом воркере становится виден максимум через
+L1_TIMEOUT секунд.
+
+Операции, которые должны быть видны сразу (delete, incr/decr), пишут ключ
+в журнал инвалидаций в L2: номер записи берётся через incr, сама запись
+живёт INVALIDATION_TIMEOUT секунд. Каждый воркер не чаще раза в
+GENERATION_CHECK_INTERVAL секунд дочитывает журнал и выбрасывает из L1
+только перечисленные ключи. Если записи журнала потерялись (вытеснены,
+два воркера получили один номер, отставание больше INVALIDATION_LOG_SIZE),
+воркер сбрасывает весь L1. clear() увеличивает общий счётчик поколения и
+сбрасывает L1 во всех воркерах.
+
+    CACHES = {
+        "default": {
+            "BACKEND": "mysite.cache.TieredCache",
+            "LOCATION": "shared",  # алиас L2 в CACHES
+            "OPTIONS": {"L1_TIMEOUT": 5, "L1_MAX_ENTRIES": 1000, "L1_MAX_BYTES": 16 * 1024 * 1024},
+        },
+        "shared": {...},
+    }
+"""
+import asyncio
+import itertools
+import math
+import os
+import pickle
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from functools import wraps
+
+from django.core.cache import caches, cache as default_cache
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+GENERATION_KEY = "tiered-cache-generation"
+INVALIDATION_SEQUENCE_KEY = "tiered-cache-invalidations"
+INVALIDATION_LOG_SIZE = 1000
+INVALIDATION_TIMEOUT = 300
+
+_MISSING = object()
+
+# значение в L2 вместе с моментом истечения (time.time())
+Expiring = namedtuple("Expiring", "expires value")
+
+
+def invalidation_key(number) -> str:
+    return f"tiered-cache-invalidated-{number}"
+
+
+class TieredCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._l2_alias = location
+        self._l1_timeout = options.get("L1_TIMEOUT", 5)
+        self._l1_max_entries = options.get("L1_MAX_ENTRIES", 1000)
+        self._l1_max_bytes = options.get("L1_MAX_BYTES", 16 * 1024 * 1024)
+        self._check_interval = options.get("GENERATION_CHECK_INTERVAL", 1)
+
+        self._l1 = OrderedDict()  # ключ -> (истекает, pickled-значение)
+        self._l1_bytes = 0
+        self._lock = threading.Lock()
+        self._generation = None
+        self._invalidation = _MISSING  # последняя прочитанная запись журнала
+        self._generation_checked_at = 0.0
+        self._counters = {"l1_hits": 0, "l1_misses": 0, "l2_hits": 0, "l2_misses": 0}
+
+    @property
+    def l2(self) -> BaseCache:
+        return caches[self._l2_alias]
+
+    def _version(self, version):
+        return self.version if version is None else version
+
+    def _l2_timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    # L1
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return _MISSING
+            expires, pickled = entry
+            if expires <= time.monotonic():
+                self._l1_discard(key)
+                return _MISSING
+            self._l1.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def _l1_set(self, key, value, timeout):
+        if timeout is not None and timeout <= 0:
+            with self._lock:
+                self._l1_discard(key)
+            return
+        ttl = self._l1_timeout if timeout is None else min(timeout, self._l1_timeout)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        if len(pickled) > self._l1_max_bytes:
+            with self._lock:
+                self._l1_discard(key)
+            return
+        with self._lock:
+            self._l1_discard(key)
+            self._l1[key] = (time.monotonic() + ttl, pickled)
+            self._l1_bytes += len(pickled)
+            while len(self._l1) > self._l1_max_entries or self._l1_bytes > self._l1_max_bytes:
+                _, (_, evicted) = self._l1.popitem(last=False)
+                self._l1_bytes -= len(evicted)
+
+    def _l1_discard(self, key):
+        # вызывается под self._lock
+        entry = self._l1.pop(key, None)
+        if entry is not None:
+            self._l1_bytes -= len(entry[1])
+
+    def _l1_clear(self):
+        with self._lock:
+            self._l1.clear()
+            self._l1_bytes = 0
+
+    # поколения и журнал инвалидаций
+
+    def _sync_generation(self):
+        now = time.monotonic()
+        if now - self._generation_checked_at < self._check_interval:
+            return
+        self._generation_checked_at = now
+        shared = self.l2.get_many([GENERATION_KEY, INVALIDATION_SEQUENCE_KEY])
+        generation = shared.get(GENERATION_KEY)
+        last = shared.get(INVALIDATION_SEQUENCE_KEY, 0)
+        if generation != self._generation or self._invalidation is _MISSING:
+            self._l1_clear()
+        elif last != self._invalidation:
+            self._apply_invalidations(self._invalidation, last)
+        self._generation, self._invalidation = generation, last
+
+    def _apply_invalidations(self, seen, last):
+        if not 0 < last - seen <= INVALIDATION_LOG_SIZE:
+            self._l1_clear()
+            return
+        names = [invalidation_key(number) for number in range(seen + 1, last + 1)]
+        keys = self.l2.get_many(names)
+        if len(keys) < len(names):
+            self._l1_clear()
+            return
+        with self._lock:
+            for key in keys.values():
+                self._l1_discard(key)
+
+    def _invalidate_key(self, l1_key):
+        """
+        Убирает ключ из L1 этого воркера и пишет его в журнал для остальных.
+        """
+        with self._lock:
+            self._l1_discard(l1_key)
+        try:
+            number = self.l2.incr(INVALIDATION_SEQUENCE_KEY)
+        except ValueError:
+            self.l2.add(INVALIDATION_SEQUENCE_KEY, 0, None)
+            number = self.l2.incr(INVALIDATION_SEQUENCE_KEY)
+        # неатомарный incr в L2 мог выдать этот номер и другому воркеру
+        if not self.l2.add(invalidation_key(number), l1_key, INVALIDATION_TIMEOUT):
+            self.invalidate()
+
+    def invalidate(self):
+        """
+        Сбрасывает L1 во всех воркерах (не позже GENERATION_CHECK_INTERVAL).
+        """
+        try:
+            generation = self.l2.incr(GENERATION_KEY)
+        except ValueError:
+            generation = time.time_ns()
+            self.l2.set(GENERATION_KEY, generation, None)
+        # журнал до этого момента уже не нужен: L1 пуст
+        self._invalidation = self.l2.get(INVALIDATION_SEQUENCE_KEY, 0)
+        self._l1_clear()
+        self._generation = generation
+        self._generation_checked_at = time.monotonic()
+
+    # API кэша
+
+    def _l2_entry(self, key, version):
+        """
+        (значение, сколько секунд ему осталось в L2 или None) либо _MISSING.
+        """
+        entry = self.l2.get(key, _MISSING, version=version)
+        if isinstance(entry, Expiring):
+            return entry.value, entry.expires - time.time()
+        return _MISSING if entry is _MISSING else (entry, None)
+
+    def _l2_set(self, method, key, value, timeout, version):
+        if timeout is not None and timeout > 0:
+            value = Expiring(time.time() + timeout, value)
+        return method(key, value, timeout, version=version)
+
+    def get(self, key, default=None, version=None):
+        version = self._version(version)
+        l1_key = self.make_and_validate_key(key, version)
+        self._sync_generation()
+
+        value = self._l1_get(l1_key)
+        if value is not _MISSING:
+            self._count("l1_hits")
+            return value
+        self._count("l1_misses")
+
+        entry = self._l2_entry(key, version)
+        if entry is _MISSING:
+            self._count("l2_misses")
+            return default
+        self._count("l2_hits")
+        value, ttl = entry
+        self._l1_set(l1_key, value, ttl)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        version = self._version(version)
+        l1_key = self.make_and_validate_key(key, version)
+        timeout = self._l2_timeout(timeout)
+        self._l2_set(self.l2.set, key, value, timeout, version)
+        self._l1_set(l1_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        version = self._version(version)
+        l1_key = self.make_and_validate_key(key, version)
+        timeout = self._l2_timeout(timeout)
+        added = self._l2_set(self.l2.add, key, value, timeout, version)
+        if added:
+            self._l1_set(l1_key, value, timeout)
+        else:
+            with self._lock:
+                self._l1_discard(l1_key)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        version = self._version(version)
+        timeout = self._l2_timeout(timeout)
+        entry = self.l2.get(key, _MISSING, version=version)
+        if not isinstance(entry, Expiring):
+            return self.l2.touch(key, timeout, version=version)
+        # срок хранится и в самом значении, его тоже надо продлить
+        self._l2_set(self.l2.set, key, entry.value, timeout, version)
+        return True
+
+    def has_key(self, key, version=None):
+        version = self._version(version)
+        self._sync_generation()
+        if self._l1_get(self.make_and_validate_key(key, version)) is not _MISSING:
+            return True
+        return self.l2.has_key(key, version=version)
+
+    def delete(self, key, version=None):
+        version = self._version(version)
+        deleted = self.l2.delete(key, version=version)
+        self._invalidate_key(self.make_and_validate_key(key, version))
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        version = self._version(version)
+        self.l2.delete_many(keys, version=version)
+        for key in keys:
+            self._invalidate_key(self.make_and_validate_key(key, version))
+
+    def incr(self, key, delta=1, version=None):
+        version = self._version(version)
+        entry = self._l2_entry(key, version)
+        if entry is _MISSING or entry[1] is None:
+            # без срока значение лежит в L2 как есть, incr бэкенда атомарен
+            value = self.l2.incr(key, delta, version=version)
+        elif entry[1] <= 0:
+            raise ValueError("Key '%s' not found" % key)
+        else:
+            value = entry[0] + delta
+            self.l2.set(key, Expiring(time.time() + entry[1], value), entry[1], version=version)
+        self._invalidate_key(self.make_and_validate_key(key, version))
+        return value
+
+    def clear(self):
+        self.l2.clear()
+        self.invalidate()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            entries, size = len(self._l1), self._l1_bytes
+        return {
+            "l1": {
+                "hits": counters["l1_hits"],
+                "misses": counters["l1_misses"],
+                "entries": entries,
+                "bytes": size,
+            },
+            "l2": {
+                "hits": counters["l2_hits"],
+                "misses": counters["l2_misses"],
+            },
+        }
+
+
+class LockedFileCache(FileBasedCache):
+    """
+    FileBasedCache для счётчиков, общих для воркеров (лимиты запросов).
+
+    Обычный FileBasedCache делает incr() как get() и set(), и параллельные
+    воркеры теряют приращения, а каждый add()/set() ещё и перебирает файлы
+    каталога в _cull(). Здесь add(), set() и incr() меняют файл ключа на
+    месте под эксклюзивной блокировкой, get() читает под разделяемой, а
+    incr() сохраняет срок жизни ключа. Вместо _cull() на каждой записи
+    каждая PRUNE_EVERY-я запись процесса удаляет просроченные файлы
+    (delete_expired(), его же вызывает `manage.py prune_cache`).
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._prune_every = params.get("OPTIONS", {}).get("PRUNE_EVERY", 1000)
+        self._writes = itertools.count(1)
+
+    def _cull(self):
+        pass
+
+    def _written(self):
+        if self._prune_every and next(self._writes) % self._prune_every == 0:
+            self.delete_expired()
+
+    @contextmanager
+    def _locked(self, key, version, lock_type=locks.LOCK_EX, create=False):
+        fname = self._key_to_file(key, version)
+        if create:
+            self._createdir()
+        while True:
+            try:
+                fd = os.open(fname, os.O_RDWR | (os.O_CREAT if create else 0), 0o600)
+            except FileNotFoundError:
+                yield None
+                return
+            with open(fd, "r+b") as f:
+                locks.lock(f, lock_type)
+                # пока ждали блокировку, файл могли удалить (delete, prune)
+                try:
+                    replaced = not os.path.samestat(os.fstat(f.fileno()), os.stat(fname))
+                except FileNotFoundError:
+                    replaced = True
+                if replaced and create:
+                    continue
+                yield None if replaced else f
+                return
+
+    def _read_entry(self, f):
+        """
+        (срок, значение) из открытого файла или None, если ключа нет.
+        """
+        if f is None:
+            return None
+        f.seek(0)
+        try:
+            expiry = pickle.load(f)
+        except EOFError:
+            return None
+        if expiry is not None and expiry < time.time():
+            return None
+        return expiry, pickle.loads(zlib.decompress(f.read()))
+
+    def _write_entry(self, f, expiry, value):
+        f.seek(0)
+        f.truncate()
+        f.write(pickle.dumps(expiry, self.pickle_protocol))
+        f.write(zlib.compress(pickle.dumps(value, self.pickle_protocol)))
+        f.flush()
+
+    def get(self, key, default=None, version=None):
+        with self._locked(key, version, locks.LOCK_SH) as f:
+            entry = self._read_entry(f)
+        return default if entry is None else entry[1]
+
+    def has_key(self, key, version=None):
+        with self._locked(key, version, locks.LOCK_SH) as f:
+            return self._read_entry(f) is not None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked(key, version, create=True) as f:
+            self._write_entry(f, self.get_backend_timeout(timeout), value)
+        self._written()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked(key, version, create=True) as f:
+            if self._read_entry(f) is not None:
+                return False
+            self._write_entry(f, self.get_backend_timeout(timeout), value)
+        self._written()
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        with self._locked(key, version) as f:
+            entry = self._read_entry(f)
+            if entry is None:
+                raise ValueError("Key '%s' not found" % key)
+            expiry, value = entry
+            value += delta
+            self._write_entry(f, expiry, value)
+        return value
+
+    def delete_expired(self) -> int:
+        """
+        Удаляет файлы просроченных ключей, возвращает их количество.
+        """
+        deleted = 0
+        for fname in self._list_cache_files():
+            try:
+                f = open(fname, "rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                locks.lock(f, locks.LOCK_EX)
+                try:
+                    expiry = pickle.load(f)
+                except EOFError:
+                    expiry = 0
+                if expiry is not None and expiry < time.time():
+                    deleted += self._delete(fname)
+        return deleted
+
+
+CachedValue = namedtuple("CachedValue", "value expires delta")
+
+
+def _is_fresh(entry, beta) -> bool:
+    if entry is None:
+        return False
+    early = entry.delta * beta * math.log(1.0 - random.random())
+    return time.time() - early < entry.expires
+
+
+def _cached_value(value, started, timeout) -> CachedValue:
+    finished = time.time()
+    expires = math.inf if timeout is None else finished + timeout
+    return CachedValue(value, expires, finished - started)
+
+
+def _stored_timeout(timeout, stale_timeout):
+    # timeout=None, как и в cache.set(), - хранить без срока
+    return None if timeout is None else timeout + stale_timeout
+
+
+def get_or_compute(key, compute, timeout=300, *, cache=None, version=None,
+                   stale_timeout=60, lock_timeout=30, wait=2.0, beta=1.0):
+    """
+    Читает значение из кэша или вычисляет его, не допуская одновременного
+    пересчёта одного ключа во всех воркерах.
+
+    Значение хранится вместе со сроком свежести и временем вычисления
+    (delta) ещё stale_timeout секунд после истечения. Пересчитывает только
+    тот, кто взял короткую блокировку (cache.add); остальные получают
+    устаревшее значение, а если его нет - ждут до wait секунд. Незадолго до
+    истечения ключ с вероятностью, растущей к концу срока, пересчитывается
+    заранее (XFetch: beta > 1 - раньше, 0 - выключено). timeout=None -
+    значение не устаревает.
+    """
+    cache = cache or default_cache
+    # блокировки нужны только в общем кэше, L1 процесса для них бесполезен
+    lock_cache = getattr(cache, "l2", cache)
+    lock_key = f"{key}:lock"
+
+    entry = cache.get(key, version=version)
+    if not isinstance(entry, CachedValue):
+        entry = None
+    if _is_fresh(entry, beta):
+        return entry.value
+
+    if lock_cache.add(lock_key, 1, lock_timeout, version=version):
+        try:
+            started = time.time()
+            value = compute()
+            cache.set(key, _cached_value(value, started, timeout), _stored_timeout(timeout, stale_timeout),
+                      version=version)
+            return value
+        finally:
+            lock_cache.delete(lock_key, version=version)
+
+    if entry is not None:
+        return entry.value
+
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key, version=version)
+        if isinstance(entry, CachedValue):
+            return entry.value
+    return compute()
+
+
+async def aget_or_compute(key, compute, timeout=300, *, cache=None, version=None,
+                          stale_timeout=60, lock_timeout=30, wait=2.0, beta=1.0):
+    """
+    Асинхронный get_or_compute: compute - корутинная функция, кэш читается
+    через aget/aadd/aset, ожидание чужого пересчёта не занимает поток.
+    """
+    cache = cache or default_cache
+    lock_cache = getattr(cache, "l2", cache)
+    lock_key = f"{key}:lock"
+
+    entry = await cache.aget(key, version=version)
+    if not isinstance(entry, CachedValue):
+        entry = None
+    if _is_fresh(entry, beta):
+        return entry.value
+
+    if await lock_cache.aadd(lock_key, 1, lock_timeout, version=version):
+        try:
+            started = time.time()
+            value = await compute()
+            await cache.aset(key, _cached_value(value, started, timeout), _stored_timeout(timeout, stale_timeout),
+                             version=version)
+            return value
+        finally:
+            await lock_cache.adelete(lock_key, version=version)
+
+    if entry is not None:
+        return entry.value
+
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        await asyncio.sleep(0.05)
+        entry = await cache.aget(key, version=version)
+        if isinstance(entry, CachedValue):
+            return entry.value
+    return await compute()
+
+
+def cached(key, timeout=300, version=None, **options):
+    """
+    Декоратор поверх get_or_compute. key (и version, если задан) - функции
+    от тех же аргументов, что и декорируемая функция.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return get_or_compute(
+                key(*args, **kwargs),
+                lambda: func(*args, **kwargs),
+                timeout,
+                version=version(*args, **kwargs) if version else None,
+                **options,
+            )
+        return wrapper
+    return decorator
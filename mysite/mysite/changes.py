@@ -0,0 +1,118 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) по дешёвым отметкам изменений.
+
+Для отдельной строки отметка - её поле updated_at (один запрос по pk).
+Для таблицы целиком (ленты, списки) - отметка изменения таблицы в общем
+кэше: время последнего save/delete любой строки в наносекундах. Модели
+подключаются через register_change_stamp() в AppConfig.ready(), для
+связей многие-ко-многим туда передаётся through-модель. bulk_create
+и queryset.update() сигналов не шлют, после них нужен touch_change_stamp().
+
+Если отметка совпала с копией клиента, view возвращает 304 до рендеринга
+шаблона или сериализации.
+"""
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+
+
+def _stamp_cache():
+    # отметка должна сразу стать видна всем воркерам, L1 процесса мешал бы
+    return getattr(cache, "l2", cache)
+
+
+def change_stamp_key(model) -> str:
+    return f"change-stamp-{model._meta.label_lower}"
+
+
+def get_change_stamp(model) -> int:
+    key, stamp_cache = change_stamp_key(model), _stamp_cache()
+    stamp = stamp_cache.get(key)
+    if stamp is None:
+        # после вытеснения ключа отметка начинается заново с текущего времени;
+        # без кэша (DummyCache) каждый запрос получает новую отметку
+        stamp = time.time_ns()
+        stamp_cache.add(key, stamp, None)
+        stamp = stamp_cache.get(key, stamp)
+    return stamp
+
+
+async def aget_change_stamp(model) -> int:
+    key, stamp_cache = change_stamp_key(model), _stamp_cache()
+    stamp = await stamp_cache.aget(key)
+    if stamp is None:
+        stamp = time.time_ns()
+        await stamp_cache.aadd(key, stamp, None)
+        stamp = await stamp_cache.aget(key, stamp)
+    return stamp
+
+
+def touch_change_stamp(*models):
+    stamp_cache = _stamp_cache()
+    for model in set(models):
+        stamp_cache.set(change_stamp_key(model), time.time_ns(), None)
+
+
+def register_change_stamp(model):
+    """
+    Обновлять отметку таблицы model при сохранении и удалении строк.
+    Для through-модели - ещё и при add/remove/clear через related-менеджер.
+    """
+    def changed(sender, **kwargs):
+        touch_change_stamp(model)
+
+    uid = f"change-stamp:{model._meta.label_lower}"
+    post_save.connect(changed, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(changed, sender=model, weak=False, dispatch_uid=uid)
+    if model._meta.auto_created:
+        m2m_changed.connect(changed, sender=model, weak=False, dispatch_uid=uid)
+
+
+def stamp_etag(stamp) -> str:
+    return str(stamp)
+
+
+def stamp_datetime(stamp) -> datetime:
+    return datetime.fromtimestamp(stamp / 1e9, tz=timezone.utc)
+
+
+def conditional_on(last_change):
+    """
+    condition() с ETag и Last-Modified из одного значения.
+    last_change(request, *args, **kwargs) возвращает datetime последнего
+    изменения или None (тогда view выполняется как обычно, например 404).
+    """
+    def cached_last_change(request, *args, **kwargs):
+        # condition() спрашивает ETag и Last-Modified по отдельности
+        if not hasattr(request, "_last_change"):
+            request._last_change = last_change(request, *args, **kwargs)
+        return request._last_change
+
+    def etag(request, *args, **kwargs):
+        changed = cached_last_change(request, *args, **kwargs)
+        return None if changed is None else stamp_etag(int(changed.timestamp() * 1e6))
+
+    return condition(etag_func=etag, last_modified_func=cached_last_change)
+
+
+def stamp_conditional_response(request, stamp):
+    """
+    304, если у клиента копия с отметкой таблицы stamp, иначе None.
+    Для асинхронных view, где condition() не работает.
+    """
+    return get_conditional_response(
+        request,
+        etag=quote_etag(stamp_etag(stamp)),
+        last_modified=int(stamp_datetime(stamp).timestamp()),
+    )
+
+
+def set_stamp_headers(response, stamp):
+    response.headers["ETag"] = quote_etag(stamp_etag(stamp))
+    response.headers["Last-Modified"] = http_date(stamp_datetime(stamp).timestamp())
+    return response
@@ -0,0 +1,46 @@
+"""
+RSS-ленты для ASGI.
+
+Django рендерит ленту синхронно, а items() - обычный queryset, поэтому под
+ASGI вся лента выполнялась бы в потоке. AsyncFeed сначала выбирает
+элементы асинхронным ORM, а потом рендерит ленту уже без запросов к БД:
+
+    class LatestProductsFeed(AsyncFeed):
+        def items(self):
+            return Product.objects.order_by("-created_at")[:5]
+
+Методы item_*() не должны обращаться к БД (например, к незагруженным FK).
+Если задан changes_model, лента отвечает 304 по отметке изменений его
+таблицы (mysite.changes) ещё до запроса элементов.
+"""
+import copy
+
+from asgiref.sync import markcoroutinefunction
+from django.contrib.gis.feeds import Feed
+
+from mysite.changes import aget_change_stamp, set_stamp_headers, stamp_conditional_response
+
+
+class AsyncFeed(Feed):
+    changes_model = None
+
+    def __init__(self):
+        # экземпляр ленты - это view, обработчик должен вызывать его как корутину
+        markcoroutinefunction(self)
+
+    async def __call__(self, request, *args, **kwargs):
+        stamp = None
+        if self.changes_model is not None:
+            stamp = await aget_change_stamp(self.changes_model)
+            not_modified = stamp_conditional_response(request, stamp)
+            if not_modified is not None:
+                return not_modified
+
+        items = [item async for item in self.items()]
+        # один экземпляр обслуживает все запросы, поэтому элементы кладём в копию
+        feed = copy.copy(self)
+        feed.items = items
+        response = Feed.__call__(feed, request, *args, **kwargs)
+        if stamp is not None:
+            set_stamp_headers(response, stamp)
+        return response
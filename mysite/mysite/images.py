@@ -0,0 +1,222 @@
+"""
+Уменьшенные копии загруженных изображений (Pillow).
+
+Для каждого изображения рядом с оригиналом сохраняются варианты
+`<имя>.<вариант>.jpg` и `<имя>.<вариант>.webp` для каждого размера из
+IMAGE_VARIANTS, например photo.jpg -> photo.thumb.jpg, photo.thumb.webp.
+Имена выводятся из имени оригинала. Чтобы при выводе не проверять файлы
+в хранилище, в строке модели рядом с полем <поле> есть поле
+<поле>_variants_for с именем файла, для которого варианты построены.
+
+Поля регистрируются через register_image_field() в AppConfig.ready():
+варианты создаются при сохранении модели с новым файлом, варианты
+прежнего файла при замене и удалении строки удаляются после коммита,
+а команда `manage.py build_image_variants` досоздаёт их для уже
+загруженных файлов.
+"""
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile, File
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# вариант -> наибольшая сторона, px
+IMAGE_VARIANTS = {
+    "thumb": 200,
+    "medium": 800,
+}
+FORMATS = {
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+}
+
+# (модель, имя поля) всех зарегистрированных полей
+IMAGE_FIELDS = []
+
+
+def variant_name(name: str, variant: str, ext: str) -> str:
+    root, _ = posixpath.splitext(name)
+    return f"{root}.{variant}.{ext}"
+
+
+def variants_field_name(field_name: str) -> str:
+    return f"{field_name}_variants_for"
+
+
+def has_variants(field_file) -> bool:
+    """
+    Построены ли варианты для текущего файла (по строке модели, без хранилища).
+    """
+    recorded = getattr(field_file.instance, variants_field_name(field_file.field.name), None)
+    return bool(field_file.name) and recorded == field_file.name
+
+
+def _variants_exist(field_file) -> bool:
+    # варианты пишутся все сразу, проверяем первый
+    name = variant_name(field_file.name, next(iter(IMAGE_VARIANTS)), next(iter(FORMATS)))
+    return field_file.storage.exists(name)
+
+
+def record_variants(field_file):
+    """
+    Запоминает в строке модели, что варианты текущего файла построены.
+    """
+    instance, attname = field_file.instance, variants_field_name(field_file.field.name)
+    setattr(instance, attname, field_file.name)
+    if instance.pk is not None:
+        # update(), а не save(): запись идёт из post_save
+        type(instance)._default_manager.filter(pk=instance.pk).update(**{attname: field_file.name})
+
+
+def _encode(image: Image.Image, ext: str) -> bytes:
+    image_format, options = FORMATS[ext]
+    if image_format == "JPEG" and image.mode != "RGB":
+        # у JPEG нет прозрачности, подкладываем белый фон
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def build_variants(field_file, overwrite=False) -> list:
+    """
+    Создаёт варианты для файла ImageField и отмечает это в строке модели.
+    Возвращает имена созданных файлов.
+    """
+    storage, name = field_file.storage, field_file.name
+    if not overwrite and _variants_exist(field_file):
+        if not has_variants(field_file):
+            record_variants(field_file)
+        return []
+    try:
+        with storage.open(name, "rb") as source:
+            original = Image.open(source)
+            original.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning("Cannot build variants of %s", name, exc_info=True)
+        return []
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ("RGB", "RGBA"):
+        original = original.convert("RGBA")
+
+    created = []
+    # от большего к меньшему: каждый следующий размер уменьшается из предыдущего
+    image = original
+    for variant, size in sorted(IMAGE_VARIANTS.items(), key=lambda item: -item[1]):
+        image = image.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        for ext in FORMATS:
+            target = variant_name(name, variant, ext)
+            if storage.exists(target):
+                storage.delete(target)
+            created.append(storage.save(target, ContentFile(_encode(image, ext))))
+    record_variants(field_file)
+    return created
+
+
+def delete_variants(field_file):
+    for variant in IMAGE_VARIANTS:
+        for ext in FORMATS:
+            field_file.storage.delete(variant_name(field_file.name, variant, ext))
+
+
+def variant_urls(field_file) -> dict:
+    """
+    {"thumb": {"jpg": url, "webp": url}, ...} или {}, если вариантов ещё нет.
+    """
+    if not field_file:
+        return {}
+    if not has_variants(field_file):
+        return {}
+    storage, name = field_file.storage, field_file.name
+    return {
+        variant: {ext: storage.url(variant_name(name, variant, ext)) for ext in FORMATS}
+        for variant in IMAGE_VARIANTS
+    }
+
+
+def srcset(urls: dict, ext: str) -> str:
+    return ", ".join(f"{urls[variant][ext]} {size}w" for variant, size in IMAGE_VARIANTS.items())
+
+
+def register_image_field(model, field_name: str):
+    """
+    Создавать варианты при сохранении model с новым файлом в field_name
+    и удалять их вместе с файлом. У model должно быть поле
+    variants_field_name(field_name).
+    """
+    IMAGE_FIELDS.append((model, field_name))
+    attr = f"_loaded_{field_name}"
+    field = model._meta.get_field(field_name)
+
+    def remember_file(sender, instance, **kwargs):
+        # до первого обращения в __dict__ лежит строка, потом FieldFile;
+        # несохранённая загрузка (Model(preview=upload)) прежним файлом не считается
+        value = instance.__dict__.get(field_name)
+        if isinstance(value, File) and not getattr(value, "_committed", False):
+            value = None
+        setattr(instance, attr, getattr(value, "name", value))
+
+    def delete_on_commit(instance, name, using):
+        # при откате транзакции строка по-прежнему ссылается на эти варианты
+        field_file = field.attr_class(instance, field, name)
+        transaction.on_commit(lambda: delete_variants(field_file), using=using)
+
+    def file_saved(sender, instance, using, **kwargs):
+        if field_name not in instance.__dict__:
+            return  # поле отложено и не менялось
+        field_file = getattr(instance, field_name)
+        previous = getattr(instance, attr, None)
+        if field_file.name != previous:
+            if previous:
+                delete_on_commit(instance, previous, using)
+            if field_file:
+                build_variants(field_file, overwrite=True)
+        setattr(instance, attr, field_file.name if field_file else None)
+
+    def file_deleted(sender, instance, using, **kwargs):
+        field_file = getattr(instance, field_name)
+        if field_file:
+            delete_on_commit(instance, field_file.name, using)
+
+    uid = f"image-variants:{model._meta.label_lower}.{field_name}"
+    post_init.connect(remember_file, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(file_saved, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(file_deleted, sender=model, weak=False, dispatch_uid=uid)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    URL оригинала и вариантов изображения вместе с готовыми srcset.
+    """
+
+    def values_sources(self) -> list:
+        # ValuesReader (mysite.values) читает и отметку о вариантах
+        return [variants_field_name(self.source)]
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        request = self.context.get("request")
+        absolute = request.build_absolute_uri if request is not None else str
+        urls = {
+            variant: {ext: absolute(url) for ext, url in formats.items()}
+            for variant, formats in variant_urls(value).items()
+        }
+        data = {"original": absolute(value.url)}
+        for variant, formats in urls.items():
+            for ext, url in formats.items():
+                data[f"{variant}_{ext}"] = url
+        if urls:
+            data["srcset"] = srcset(urls, "jpg")
+            data["srcset_webp"] = srcset(urls, "webp")
+        return data
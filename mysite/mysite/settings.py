@@ -86,6 +86,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'requestdataapp.metrics.MetricsMiddleware',
+    'requestdataapp.queries.QueryBudgetMiddleware',
+    # отказ по лимиту до сессий и аутентификации
+    'requestdataapp.midddlewares.RateLimitMiddleware',
     #'django.middleware.security.cache.UpdateCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -98,7 +102,6 @@ MIDDLEWARE = [
     'django.contrib.admindocs.middleware.XViewMiddleware',
 
     'requestdataapp.midddlewares.set_useragent_on_request_middleware',
-    'requestdataapp.midddlewares.CountRequestMiddleware',
 
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     #'django.middleware.security.cache.FetchFromCacheMiddleware',
@@ -139,11 +142,61 @@ DATABASES = {
 
 CACHES ={
     "default":{
+        "BACKEND": "mysite.cache.TieredCache",
+        "LOCATION": "shared",
+        "OPTIONS": {
+            "L1_TIMEOUT": 5,
+            "L1_MAX_ENTRIES": 1000,
+            "L1_MAX_BYTES": 16 * 1024 * 1024,
+            "GENERATION_CHECK_INTERVAL": 1,
+        },
+    },
+    "shared":{
         "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
         "LOCATION": "/var/tmp/django_cache",
-    }
+    },
+    # счётчики лимитов: атомарный incr в Redis, если он есть, иначе файлы
+    # под блокировкой, просроченные удаляются каждую PRUNE_EVERY-ю запись
+    "ratelimit": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("DJANGO_RATELIMIT_REDIS_URL"),
+    } if os.getenv("DJANGO_RATELIMIT_REDIS_URL") else {
+        "BACKEND": "mysite.cache.LockedFileCache",
+        "LOCATION": "/var/tmp/django_ratelimit",
+        "OPTIONS": {"PRUNE_EVERY": 1000},
+    },
 }
 
+# Снимки метрик каждого воркера для /metrics
+METRICS_DIR = os.getenv("DJANGO_METRICS_DIR", "/var/tmp/django_metrics")
+METRICS_FLUSH_INTERVAL = 1
+# кому доступен /metrics, кроме сотрудников: адреса и Bearer-токен
+METRICS_ALLOWED_IPS = (os.getenv("DJANGO_METRICS_ALLOWED_IPS") or "127.0.0.1,::1").split(",")
+METRICS_TOKEN = os.getenv("DJANGO_METRICS_TOKEN", "")
+
+# Бюджет запросов к БД на один HTTP-запрос и порог повторов одного SQL (N+1)
+# в production учёт выключен: он оборачивает каждый запрос к БД
+QUERY_BUDGET_ENABLED = DEBUG or os.getenv("DJANGO_QUERY_BUDGET_ENABLED", "0") == "1"
+QUERY_BUDGET = 50
+QUERY_BUDGETS = {}  # имя url -> бюджет
+QUERY_REPEAT_THRESHOLD = 10
+QUERY_BUDGET_RAISE = os.getenv("DJANGO_QUERY_BUDGET_RAISE", "0") == "1"
+
+# Заранее отрендеренные sitemap (manage.py build_sitemaps) и адрес сайта в них
+SITEMAP_ROOT = os.getenv("DJANGO_SITEMAP_ROOT", BASE_DIR / "sitemaps")
+SITEMAP_BASE_URL = os.getenv("DJANGO_SITEMAP_BASE_URL", "http://localhost:8000")
+
+# Счётчики лимитов живут в отдельном кэше, общем для всех воркеров
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_CACHE = "ratelimit"
+# (область, префикс пути без языка, запросов, за секунд) - первое совпадение
+RATE_LIMITS = [
+    ("admin", "/admin/", 300, 60),
+    ("api", "/api/", 120, 60),
+    ("api", "/shop/api/", 120, 60),
+    ("html", "/", 600, 60),
+]
+
 CACHE_MIDDLEWARE_SECONDS = 200
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -1,3 +1,25 @@
+"""
+Sitemap index и разделы по страницам (не больше Sitemap.limit адресов).
+
+`manage.py build_sitemaps` рендерит их заранее в SITEMAP_ROOT в виде gzip:
+sitemap.xml.gz (индекс) и sitemap-<раздел>-<страница>.xml.gz. Представления
+отдают эти файлы без запросов к БД, с Last-Modified по времени последнего
+изменения содержимого. Пока файлов нет, sitemap рендерится на лету.
+"""
+import gzip
+import os
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.sitemaps import views as sitemap_views
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
 from blogapp.sitemap import BlogSitemap
 from shopapp.sitemap import ShopSitemap
 
@@ -5,3 +27,98 @@ sitemaps = {
     'blog': BlogSitemap,
     'shop': ShopSitemap,
 }
+
+INDEX_FILE = "sitemap.xml.gz"
+
+
+def section_file(section: str, page: int) -> str:
+    return f"sitemap-{section}-{page}.xml.gz"
+
+
+def render_sitemaps(base_url: str):
+    """
+    Отдаёт пары (имя файла, XML) для индекса и всех страниц разделов.
+    """
+    url = urlsplit(base_url)
+    site = SimpleNamespace(domain=url.netloc, name=url.netloc)
+    index = []
+    for section, sitemap_class in sitemaps.items():
+        sitemap = sitemap_class()
+        location = f"{url.scheme}://{url.netloc}{reverse('sitemap-section', kwargs={'section': section})}"
+        for page in sitemap.paginator.page_range:
+            urls = sitemap.get_urls(page=page, site=site, protocol=url.scheme)
+            yield section_file(section, page), render_to_string("sitemap.xml", {"urlset": urls})
+            index.append(sitemap_views.SitemapIndexItem(
+                location if page == 1 else f"{location}?p={page}",
+                getattr(sitemap, "latest_lastmod", None),
+            ))
+    yield INDEX_FILE, render_to_string("sitemap_index.xml", {"sitemaps": index})
+
+
+def write_sitemaps(directory, base_url: str) -> dict:
+    """
+    Записывает файлы sitemap в directory. Файлы с прежним содержимым не
+    перезаписываются, чтобы их mtime (и Last-Modified) не менялся.
+    Возвращает {"written": [...], "unchanged": [...], "removed": [...]}.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    result = {"written": [], "unchanged": [], "removed": []}
+    for name, content in render_sitemaps(base_url):
+        path = directory / name
+        # mtime=0 в заголовке gzip: одинаковый XML даёт одинаковые байты
+        data = gzip.compress(content.encode(), mtime=0)
+        if path.exists() and path.read_bytes() == data:
+            result["unchanged"].append(name)
+            continue
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        result["written"].append(name)
+
+    current = set(result["written"]) | set(result["unchanged"])
+    for path in directory.glob("sitemap*.xml.gz"):
+        if path.name not in current:
+            path.unlink()
+            result["removed"].append(path.name)
+    return result
+
+
+def serve_sitemap_file(request, name):
+    """
+    Ответ с готовым файлом или None, если его нет.
+    """
+    path = Path(settings.SITEMAP_ROOT) / name
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    if not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), mtime):
+        return HttpResponseNotModified()
+    if "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", ""):
+        response = FileResponse(path.open("rb"), content_type="application/xml")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(gzip.decompress(path.read_bytes()), content_type="application/xml")
+    response.headers["Last-Modified"] = http_date(mtime)
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@sitemap_views.x_robots_tag
+def index(request):
+    response = serve_sitemap_file(request, INDEX_FILE)
+    if response is None:
+        response = sitemap_views.index(request, sitemaps, sitemap_url_name="sitemap-section")
+    return response
+
+
+@sitemap_views.x_robots_tag
+def section(request, section):
+    page = request.GET.get("p", "1")
+    response = None
+    if section in sitemaps and page.isdigit():
+        response = serve_sitemap_file(request, section_file(section, int(page)))
+    if response is None:
+        response = sitemap_views.sitemap(request, sitemaps, section=section)
+    return response
@@ -0,0 +1,227 @@
+import gzip
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from mysite.cache import (
+    INVALIDATION_SEQUENCE_KEY, invalidation_key, get_or_compute, aget_or_compute, cached, CachedValue,
+)
+from shopapp.models import Product
+from shopapp.sitemap import ShopSitemap
+
+TIERED_CACHES = {
+    "default": {
+        "BACKEND": "mysite.cache.TieredCache",
+        "LOCATION": "shared",
+        "OPTIONS": {"L1_TIMEOUT": 60, "L1_MAX_ENTRIES": 2, "GENERATION_CHECK_INTERVAL": 0},
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tiered-cache-tests",
+    },
+}
+
+
+@override_settings(CACHES=TIERED_CACHES)
+class TieredCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        # отдельный экземпляр на тест, чтобы счётчики не копились между тестами
+        self.cache = caches.create_connection("default")
+        self.shared = caches["shared"]
+        self.cache.clear()
+
+    def test_second_read_is_served_from_l1(self):
+        self.shared.set("key", "value")
+        self.assertEqual(self.cache.get("key"), "value")
+        self.assertEqual(self.cache.get("key"), "value")
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["l1"]["hits"], 1)
+        self.assertEqual(stats["l2"]["hits"], 1)
+
+    def test_l1_is_bounded(self):
+        for key in ("a", "b", "c"):
+            self.cache.set(key, key)
+        self.assertEqual(self.cache.stats()["l1"]["entries"], 2)
+        self.assertEqual(self.cache.get("a"), "a")
+
+    def test_invalidation_from_another_worker_drops_only_that_key(self):
+        self.cache.set("counter", 1)
+        self.cache.set("kept", "old")
+        self.shared.set("kept", "new")
+
+        # другой воркер: свой L1 поверх того же L2
+        other = caches.create_connection("default")
+        self.assertEqual(other.incr("counter"), 2)
+        self.assertEqual(self.cache.get("counter"), 2)
+        self.assertEqual(self.cache.get("kept"), "old")
+
+        other.delete("kept")
+        self.assertIsNone(self.cache.get("kept"))
+
+    def test_lost_invalidations_drop_whole_l1(self):
+        self.cache.set("key", "old")
+        self.assertEqual(self.cache.get("key"), "old")
+        self.shared.set("key", "new")
+        caches.create_connection("default").delete("unrelated")
+        # запись журнала вытеснена до того, как этот воркер её прочитал
+        self.shared.delete(invalidation_key(self.shared.get(INVALIDATION_SEQUENCE_KEY)))
+        self.assertEqual(self.cache.get("key"), "new")
+
+    def test_clear_drops_l1_in_other_workers(self):
+        self.cache.set("key", "old")
+        self.shared.set("key", "new")
+        caches.create_connection("default").clear()
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_l1_does_not_outlive_l2_entry(self):
+        other = caches.create_connection("default")
+        other.set("key", "value", 2)
+        with mock.patch("mysite.cache.time.time", return_value=time.time() + 1.5):
+            self.assertEqual(self.cache.get("key"), "value")
+        expires, _ = self.cache._l1[self.cache.make_key("key")]
+        self.assertLessEqual(expires - time.monotonic(), 0.5)
+
+    def test_versions_are_passed_to_l2(self):
+        self.cache.set("key", "v2", version=2)
+        self.assertIsNone(self.cache.get("key"))
+        self.assertTrue(self.shared.has_key("key", version=2))
+        self.assertEqual(caches.create_connection("default").get("key", version=2), "v2")
+
+    def test_expiring_values_support_incr_and_touch(self):
+        self.cache.set("counter", 1, 60)
+        self.assertEqual(self.cache.incr("counter", 2), 3)
+        self.assertTrue(self.cache.touch("counter", 120))
+        self.assertEqual(caches.create_connection("default").get("counter"), 3)
+
+
+@override_settings(CACHES=TIERED_CACHES)
+class GetOrComputeTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = caches["default"]
+        self.cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_fresh_value_is_computed_once(self):
+        self.assertEqual(get_or_compute("key", self.compute, 60, beta=0), 1)
+        self.assertEqual(get_or_compute("key", self.compute, 60, beta=0), 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_timeout_none_never_expires(self):
+        async def acompute():
+            return self.compute()
+
+        self.assertEqual(get_or_compute("key", self.compute, None), 1)
+        self.assertEqual(async_to_sync(aget_or_compute)("akey", acompute, None), 2)
+        self.assertEqual(self.cache.get("key").expires, float("inf"))
+        self.assertEqual(self.cache.get("akey").expires, float("inf"))
+        self.assertEqual(get_or_compute("key", self.compute, None), 1)
+        self.assertEqual(self.calls, 2)
+
+    def test_stale_value_is_served_while_another_worker_recomputes(self):
+        self.cache.set("key", CachedValue("stale", expires=0, delta=0), 60)
+        caches["shared"].add("key:lock", 1, 30)
+
+        self.assertEqual(get_or_compute("key", self.compute, 60), "stale")
+        self.assertEqual(self.calls, 0)
+
+    def test_expired_value_is_recomputed_by_lock_holder(self):
+        self.cache.set("key", CachedValue("stale", expires=0, delta=0), 60)
+        self.assertEqual(get_or_compute("key", self.compute, 60), 1)
+        self.assertFalse(caches["shared"].has_key("key:lock"))
+
+    def test_waits_for_value_when_nothing_is_cached(self):
+        caches["shared"].add("key:lock", 1, 30)
+        with mock.patch("mysite.cache.time.sleep", side_effect=lambda _: self.cache.set(
+            "key", CachedValue("computed elsewhere", expires=float("inf"), delta=0), 60,
+        )):
+            self.assertEqual(get_or_compute("key", self.compute, 60), "computed elsewhere")
+        self.assertEqual(self.calls, 0)
+
+    def test_cached_decorator(self):
+        @cached(key=lambda x: f"square-{x}", timeout=60)
+        def square(x):
+            self.calls += 1
+            return x * x
+
+        self.assertEqual(square(3), 9)
+        self.assertEqual(square(3), 9)
+        self.assertEqual(self.calls, 1)
+
+
+class SitemapTestCase(TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'products-fixture.json',
+        'groups-fixture.json',
+    ]
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        settings = override_settings(SITEMAP_ROOT=self.root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def get(self, url, **extra):
+        return self.client.get(url, HTTP_USER_AGENT="Mozilla/5.0", HTTP_ACCEPT_ENCODING="gzip", **extra)
+
+    def build(self):
+        out = StringIO()
+        call_command("build_sitemaps", output=self.root.name, base_url="https://example.com", stdout=out)
+        return out.getvalue()
+
+    def test_rendered_on_the_fly_without_files(self):
+        response = self.get("/sitemap.xml")
+        self.assertContains(response, "http://testserver/sitemap-shop.xml")
+        response = self.get("/sitemap-shop.xml")
+        self.assertContains(response, "http://testserver/en/shop/products/1</loc>")
+
+    def test_prebuilt_files_are_served_without_queries(self):
+        self.build()
+        with self.assertNumQueries(0):
+            index = self.get("/sitemap.xml")
+            shop = self.get("/sitemap-shop.xml")
+        self.assertEqual(index["Content-Encoding"], "gzip")
+        self.assertIn("Last-Modified", index)
+        self.assertIn(b"https://example.com/sitemap-blog.xml", gzip.decompress(b"".join(index.streaming_content)))
+        self.assertIn(b"https://example.com/en/shop/products/1</loc>", gzip.decompress(b"".join(shop.streaming_content)))
+
+        response = self.get("/sitemap.xml", HTTP_IF_MODIFIED_SINCE=index["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get("/sitemap-shop.xml", HTTP_USER_AGENT="Mozilla/5.0")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertContains(response, "https://example.com/en/shop/products/1</loc>")
+
+    def test_rebuild_keeps_unchanged_files(self):
+        self.build()
+        self.assertIn("0 written", self.build())
+        Product.objects.create(name="sitemap", created_by_id=1)
+        # страница раздела магазина и индекс с новым lastmod
+        self.assertIn("2 written, 1 unchanged", self.build())
+
+    def test_sections_are_paginated(self):
+        with mock.patch.object(ShopSitemap, "limit", 1):
+            self.build()
+            pages = Product.objects.count()
+            response = self.get("/sitemap.xml")
+            self.assertIn(
+                f"https://example.com/sitemap-shop.xml?p={pages}".encode(),
+                gzip.decompress(b"".join(response.streaming_content)),
+            )
+            response = self.get("/sitemap-shop.xml", data={"p": 2})
+            self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn(f"Removed sitemap-shop-{pages}.xml.gz", self.build())
@@ -19,9 +19,9 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.i18n import i18n_patterns
-from django.contrib.sitemaps.views import sitemap
 
-from .sitemaps import sitemaps
+from . import sitemaps
+from requestdataapp.metrics import metrics_view
 
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
@@ -37,7 +37,9 @@ urlpatterns = [
     path("api/schema/swagger/", SpectacularSwaggerView.as_view(url_name='schema'), name="swagger"),
     path("api/schema/redocs/", SpectacularRedocView.as_view(url_name='schema'), name="redoc"),
 
-    path("sitemap.xml", sitemap, {"sitemaps": sitemaps}, name="django.contrib.sitemaps.views.sitemap")
+    path("sitemap.xml", sitemaps.index, name="sitemap"),
+    path("sitemap-<section>.xml", sitemaps.section, name="sitemap-section"),
+    path("metrics", metrics_view, name="metrics"),
 ]
 urlpatterns += i18n_patterns(
     path("accounts/", include("myauth.urls")),
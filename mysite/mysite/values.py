@@ -0,0 +1,216 @@
+"""
+Быстрое чтение списков для ModelSerializer через values().
+
+Обычный list() создаёт экземпляр модели на каждую строку, а сериализатор
+для каждого поля вызывает get_attribute() и to_representation(). Здесь
+queryset читает values() ровно по полям Meta.fields, а каждое поле
+кодируется заранее подобранной функцией: Decimal и datetime - так же, как
+это делает DRF, ImageField - сразу в URL из имени файла. Для полей без
+быстрого кодировщика (например, ImageVariantsField) вызывается их
+to_representation() с тем же значением, что дал бы экземпляр модели. Если
+такому полю нужны ещё колонки строки, оно перечисляет их в методе
+values_sources(), и FieldFile получает вместо экземпляра саму строку.
+
+Сериализатор, у которого есть поля не из колонок модели (вложенные,
+SerializerMethodField, source через точку), работает по-старому.
+
+    class ProductViewSet(ValuesListMixin, viewsets.ModelViewSet):
+        ...
+"""
+import decimal
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import fields as drf_fields
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+# поля, to_representation которых для значения из БД ничего не меняет
+PLAIN_FIELDS = (
+    drf_fields.BooleanField,
+    drf_fields.CharField,
+    drf_fields.FloatField,
+    drf_fields.IntegerField,
+    drf_fields.ReadOnlyField,
+)
+
+
+def _model_field(model, source):
+    if source == "pk":
+        return model._meta.pk
+    try:
+        return model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+
+
+def _is_column(model_field) -> bool:
+    return model_field is not None and model_field.concrete and not model_field.many_to_many
+
+
+def _decimal_encoder(field):
+    coerce_to_string = getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.decimal_places is None:
+        return field.to_representation
+    quantum = decimal.Decimal(".1") ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def encode(value):
+        return "{:f}".format(value.quantize(quantum, rounding=rounding, context=context))
+    return encode
+
+
+def _datetime_encoder(field):
+    output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+    if output_format is None or output_format.lower() != drf_fields.ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def encode(value):
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+    return encode
+
+
+def _file_url_encoder(field, model_field):
+    if not getattr(field, "use_url", api_settings.UPLOADED_FILES_USE_URL):
+        return lambda name: name or None
+    storage = model_field.storage
+    request = field.context.get("request")
+    absolute = request.build_absolute_uri if request is not None else str
+
+    def encode(name):
+        return absolute(storage.url(name)) if name else None
+    return encode
+
+
+class _RowInstance:
+    """
+    Вместо экземпляра модели у FieldFile: колонки строки values() как атрибуты.
+    """
+    __slots__ = ("_row",)
+
+    def __init__(self, row):
+        self._row = row
+
+    def __getattr__(self, name):
+        try:
+            return self._row[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+def _file_attr_encoder(field, model_field):
+    # to_representation() ждёт FieldFile, как у экземпляра модели
+    attr_class = model_field.attr_class
+
+    def encode(name, row):
+        return field.to_representation(attr_class(_RowInstance(row), model_field, name))
+    return encode
+
+
+def _encoder(field, model_field):
+    """
+    (кодировщик, кодировать ли None, нужна ли кодировщику вся строка)
+    для поля сериализатора.
+    """
+    if isinstance(model_field, models.FileField):
+        if type(field) in (drf_fields.FileField, drf_fields.ImageField):
+            return _file_url_encoder(field, model_field), True, False
+        return _file_attr_encoder(field, model_field), True, True
+    if isinstance(field, drf_fields.DecimalField):
+        return _decimal_encoder(field), False, False
+    if isinstance(field, drf_fields.DateTimeField):
+        return _datetime_encoder(field), False, False
+    if type(field) in PLAIN_FIELDS:
+        return None, False, False
+    if isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+        return None, False, False  # values() уже отдаёт id
+    return field.to_representation, False, False
+
+
+@lru_cache(maxsize=None)
+def values_reader(serializer_class):
+    """
+    ValuesReader для serializer_class или None, если его поля не сводятся
+    к колонкам модели.
+    """
+    model = serializer_class.Meta.model
+    columns, extra_sources = [], []
+    for field in serializer_class().fields.values():
+        if field.write_only:
+            continue
+        if isinstance(field, (drf_fields.SerializerMethodField, drf_fields.HiddenField)):
+            return None
+        if "." in field.source or field.source == "*":
+            return None
+        if not _is_column(_model_field(model, field.source)):
+            return None
+        columns.append((field.field_name, field.source))
+        extra_sources.extend(getattr(field, "values_sources", list)())
+    if not all(_is_column(_model_field(model, source)) for source in extra_sources):
+        return None
+    return ValuesReader(serializer_class, columns, extra_sources)
+
+
+class ValuesReader:
+
+    def __init__(self, serializer_class, columns, extra_sources=()):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.columns = columns
+        self.sources = list(dict.fromkeys([*(source for _, source in columns), *extra_sources]))
+
+    def values(self, queryset, ordering=()):
+        # поля сортировки нужны курсорной пагинации, даже если их нет в ответе
+        ordering = [
+            name.lstrip("-") for name in [*queryset.query.order_by, *ordering]
+            if isinstance(name, str) and name != "?"
+        ]
+        return queryset.values(*dict.fromkeys([*self.sources, *ordering]))
+
+    def encoders(self, context) -> list:
+        fields = self.serializer_class(context=context).fields
+        encoders = []
+        for name, source in self.columns:
+            encoders.append((name, source, *_encoder(fields[name], _model_field(self.model, source))))
+        return encoders
+
+    def encode(self, rows, context) -> list:
+        encoders = self.encoders(context)
+        data = []
+        for row in rows:
+            item = {}
+            for name, source, encode, encode_none, with_row in encoders:
+                value = row[source]
+                if encode is not None and (value is not None or encode_none):
+                    value = encode(value, row) if with_row else encode(value)
+                item[name] = value
+            data.append(item)
+        return data
+
+
+class ValuesListMixin:
+    """
+    list() через ValuesReader, если сериализатор это позволяет.
+    """
+
+    def list(self, request, *args, **kwargs):
+        reader = values_reader(self.get_serializer_class())
+        if reader is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        get_ordering = getattr(self.paginator, "get_ordering", None)
+        ordering = get_ordering(request, queryset, self) if get_ordering else ()
+        queryset = reader.values(queryset, ordering)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(reader.encode(page, self.get_serializer_context()))
+        return Response(reader.encode(queryset, self.get_serializer_context()))
@@ -0,0 +1,184 @@
+"""
+Нагрузочный бенчмарк основных страниц и API внутри процесса.
+
+Запросы идут через тестовый клиент Django по полному стеку middleware,
+для каждого url считаются p50/p95/p99 времени ответа, число запросов к
+БД и пиковая память (tracemalloc, отдельным проходом, чтобы не искажать
+время). Запускается командой `manage.py bench`.
+
+С --serializers дополнительно меряется скорость сериализации списков API
+в строках в секунду: обычный ModelSerializer(many=True) по экземплярам
+моделей против ValuesReader (mysite.values) по values().
+"""
+import math
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import Client, RequestFactory
+from django.urls import reverse
+from django.utils import translation
+
+from mysite.values import values_reader
+from shopapp.models import Order, Product
+from shopapp.serializers import OrderSerializer, ProductSerializer
+
+from .queries import QueryRecorder
+from .seed import seed, counts_for_scale
+
+Endpoint = namedtuple("Endpoint", "name url_name args data login", defaults=((), None, False))
+
+ENDPOINTS = [
+    Endpoint("products_list", "shopapp:products_list"),
+    Endpoint("product_details", "shopapp:products_details", (1,)),
+    Endpoint("orders_list", "shopapp:order_list", login=True),
+    Endpoint("api_products", "shopapp:product-list"),
+    Endpoint("api_products_search", "shopapp:product-list", data={"search": "steel"}),
+    Endpoint("api_orders", "shopapp:order-list"),
+    Endpoint("products_csv", "shopapp:product-download-csv"),
+    Endpoint("products_export", "shopapp:products_export"),
+    Endpoint("orders_export", "shopapp:orders_export", login=True),
+    Endpoint("articles_list", "blogapp:article_list"),
+    Endpoint("users_list", "myauth:user_list"),
+    Endpoint("login_page", "myauth:login"),
+]
+
+SERIALIZERS = {
+    "products": (ProductSerializer, Product.objects.order_by("pk")),
+    "orders": (OrderSerializer, Order.objects.order_by("pk")),
+}
+
+
+def parse_scale(value: str) -> int:
+    """
+    "1k" -> 1000, "100k" -> 100000, "1m" -> 1000000.
+    """
+    value = value.strip().lower()
+    multiplier = {"k": 1000, "m": 1000000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * multiplier)
+
+
+def seed_bench(scale: int, random_seed: int = 0) -> dict:
+    """
+    Заполняет пустую БД данными в масштабе scale и создаёт суперпользователя
+    bench, от имени которого идут запросы к закрытым страницам.
+    """
+    counts = counts_for_scale(scale)
+    seed(counts, random_seed)
+    User.objects.create_superuser(username="bench", password=None)
+    return counts
+
+
+def percentile(values, q) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def _request(client, url, data):
+    response = client.get(url, data, HTTP_USER_AGENT="Mozilla/5.0")
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    return response, size
+
+
+def run_endpoint(endpoint: Endpoint, iterations: int, user=None) -> dict:
+    client = Client()
+    if endpoint.login and user is not None:
+        client.force_login(user)
+    with translation.override(settings.LANGUAGES[0][0]):
+        url = reverse(endpoint.url_name, args=endpoint.args)
+
+    response, size = _request(client, url, endpoint.data)  # прогрев
+    timings, queries = [], []
+    for _ in range(iterations):
+        with QueryRecorder(fingerprints=False) as recorder:
+            started = time.perf_counter()
+            _request(client, url, endpoint.data)
+            timings.append(time.perf_counter() - started)
+        queries.append(recorder.count)
+
+    tracemalloc.start()
+    try:
+        _request(client, url, endpoint.data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "url": url,
+        "status": response.status_code,
+        "bytes": size,
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "p99_ms": round(percentile(timings, 99) * 1000, 3),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+        "queries": round(sum(queries) / len(queries), 2),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float = None) -> tuple:
+    """
+    Сравнивает два прогона. Возвращает строки отчёта и список регрессий:
+    p95 вырос больше чем на threshold процентов или стало больше запросов.
+    """
+    lines, regressions = [], []
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous is None:
+            lines.append(f"{name}: new")
+            continue
+        if current["status"] != previous["status"]:
+            lines.append(f"{name}: status {previous['status']} -> {current['status']}, not compared")
+            continue
+        deltas = {
+            key: (current[key] - previous[key]) / previous[key] * 100 if previous[key] else 0.0
+            for key in ("p50_ms", "p95_ms", "p99_ms")
+        }
+        queries_delta = current["queries"] - previous["queries"]
+        lines.append(
+            f"{name}: p50 {deltas['p50_ms']:+.1f}%, p95 {deltas['p95_ms']:+.1f}%, "
+            f"p99 {deltas['p99_ms']:+.1f}%, queries {queries_delta:+g}"
+        )
+        if threshold is not None and deltas["p95_ms"] > threshold:
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if queries_delta > 0:
+            regressions.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+    return lines, regressions
+
+
+def _rows_per_second(serialize, iterations: int) -> tuple:
+    serialize()  # прогрев
+    best, rows = None, 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        rows = len(serialize())
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return rows, rows / best if best else 0.0
+
+
+def run_serializer(name: str, rows: int, iterations: int) -> dict:
+    """
+    Строк в секунду (лучший из iterations проходов, вместе с чтением из БД)
+    для первых rows строк списка name из SERIALIZERS.
+    """
+    serializer_class, queryset = SERIALIZERS[name]
+    queryset = queryset[:rows]
+    context = {"request": RequestFactory().get("/")}
+    reader = values_reader(serializer_class)
+
+    count, before = _rows_per_second(
+        lambda: serializer_class(queryset.all(), many=True, context=context).data, iterations)
+    _, after = _rows_per_second(
+        lambda: reader.encode(reader.values(queryset.all()), context), iterations)
+    return {
+        "rows": count,
+        "before_rows_per_s": round(before),
+        "after_rows_per_s": round(after),
+        "speedup": round(after / before, 2) if before else None,
+    }
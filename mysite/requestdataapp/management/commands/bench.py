@@ -0,0 +1,139 @@
+import json
+import platform
+import sys
+import tempfile
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from requestdataapp.bench import (
+    ENDPOINTS, SERIALIZERS, parse_scale, seed_bench, run_endpoint, run_serializer, compare,
+)
+
+LOCMEM = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+# тестовая БД SQLite по умолчанию в памяти, и --keepdb нечего переиспользовать
+BENCH_SQLITE_NAME = "bench.sqlite3"
+
+
+class Command(BaseCommand):
+
+    """
+    Benchmarks shop, blog and auth endpoints on a seeded test database
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", default="1k", help="Rows to seed: 1k, 100k, 1m or a number")
+        parser.add_argument("--iterations", type=int, default=50, help="Requests per endpoint")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed of the dataset")
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            choices=[endpoint.name for endpoint in ENDPOINTS],
+            help="Run only these endpoints (can be repeated)",
+        )
+        parser.add_argument(
+            "--serializers",
+            action="store_true",
+            help="Also measure API list serialization in rows/s, model instances vs values()",
+        )
+        parser.add_argument("--serializer-rows", type=int, default=1000, help="Rows per serialization pass")
+        parser.add_argument("--output", help="Write results as JSON to this file")
+        parser.add_argument("--baseline", help="JSON file of a previous run to compare with")
+        parser.add_argument(
+            "--max-regression",
+            type=float,
+            help="Fail if p95 grew by more than this many percent or queries grew",
+        )
+        parser.add_argument("--keepdb", action="store_true", help="Keep and reuse the test database")
+
+    def handle(self, *args, **options):
+        scale = parse_scale(options["scale"])
+        endpoints = [e for e in ENDPOINTS if not options["endpoint"] or e.name in options["endpoint"]]
+
+        old_name = connection.settings_dict["NAME"]
+        test_settings = connection.settings_dict["TEST"]
+        old_test_name = test_settings["NAME"]
+        if connection.vendor == "sqlite" and not old_test_name:
+            test_settings["NAME"] = str(Path(settings.BASE_DIR) / BENCH_SQLITE_NAME)
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False,
+                                           keepdb=options["keepdb"])
+        try:
+            with tempfile.TemporaryDirectory() as metrics_dir, override_settings(
+                DEBUG=False,
+                ALLOWED_HOSTS=["testserver"],
+                CACHES={**settings.CACHES, "shared": LOCMEM, "ratelimit": LOCMEM},
+                RATE_LIMIT_ENABLED=False,
+                METRICS_DIR=metrics_dir,
+                QUERY_BUDGET=None,
+                QUERY_REPEAT_THRESHOLD=sys.maxsize,
+            ):
+                results = self.run(scale, endpoints, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+            test_settings["NAME"] = old_test_name
+
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options["baseline"]:
+            baseline = json.loads(Path(options["baseline"]).read_text())
+            lines, regressions = compare(results, baseline, options["max_regression"])
+            self.stdout.write(f"Compared with {options['baseline']}:")
+            for line in lines:
+                self.stdout.write(f"  {line}")
+            if options["max_regression"] is not None and regressions:
+                raise CommandError("Regressions:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Benchmark finished"))
+
+    def run(self, scale, endpoints, options) -> dict:
+        if User.objects.exists():
+            self.stdout.write("Reusing seeded test database")
+            rows = {}
+        else:
+            self.stdout.write(f"Seeding {scale} rows")
+            rows = seed_bench(scale, options["seed"])
+        # в сохранённой БД могли остаться данные без пользователя bench
+        user, _ = User.objects.get_or_create(
+            username="bench", defaults={"is_staff": True, "is_superuser": True},
+        )
+
+        results = {
+            "meta": {
+                "scale": scale,
+                "seed": options["seed"],
+                "rows": rows,
+                "iterations": options["iterations"],
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "started_at": timezone.now().isoformat(),
+            },
+            "endpoints": {},
+        }
+        for endpoint in endpoints:
+            result = run_endpoint(endpoint, options["iterations"], user)
+            results["endpoints"][endpoint.name] = result
+            self.stdout.write(
+                f"{endpoint.name:<22} {result['status']} p50 {result['p50_ms']:>9} ms  "
+                f"p95 {result['p95_ms']:>9} ms  p99 {result['p99_ms']:>9} ms  "
+                f"{result['queries']:>6} queries  {result['peak_memory_kb']:>9} KB"
+            )
+
+        if options["serializers"]:
+            results["serializers"] = {}
+            for name in SERIALIZERS:
+                result = run_serializer(name, options["serializer_rows"], options["iterations"])
+                results["serializers"][name] = result
+                self.stdout.write(
+                    f"serialize {name:<12} {result['rows']:>7} rows  "
+                    f"before {result['before_rows_per_s']:>9} rows/s  "
+                    f"after {result['after_rows_per_s']:>9} rows/s  x{result['speedup']}"
+                )
+        return results
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+
+    """
+    Deletes expired entries of a file cache that prunes itself only every few writes
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cache", default=settings.RATE_LIMIT_CACHE, help="Cache alias to prune")
+
+    def handle(self, *args, **options):
+        cache = caches[options["cache"]]
+        if not hasattr(cache, "delete_expired"):
+            raise CommandError(f"Cache {options['cache']!r} expires its keys by itself")
+        deleted = cache.delete_expired()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired entries"))
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management import BaseCommand
+
+from requestdataapp.bench import parse_scale
+from requestdataapp.seed import GENERATORS, counts_for_scale, seed
+
+
+class Command(BaseCommand):
+
+    """
+    Generates synthetic users, products, orders and articles for load testing
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            default="10k",
+            help="Products and orders to create (1k, 100k, 1m); users and articles are derived from it",
+        )
+        for kind in GENERATORS:
+            parser.add_argument(f"--{kind}", help=f"Number of {kind} to create, overrides --scale")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed, the same seed gives the same data")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes writing disjoint pk ranges in parallel (ignored on SQLite)",
+        )
+
+    def handle(self, *args, **options):
+        counts = counts_for_scale(parse_scale(options["scale"]))
+        for kind in GENERATORS:
+            if options[kind] is not None:
+                counts[kind] = parse_scale(options[kind])
+        self.stdout.write("Seeding " + ", ".join(f"{count} {kind}" for kind, count in counts.items()))
+
+        done = dict.fromkeys(GENERATORS, 0)
+
+        def progress(kind, rows):
+            done[kind] += rows
+            self.stdout.write(f"  {kind}: {done[kind]}/{counts[kind]}")
+
+        started = time.perf_counter()
+        ranges = seed(counts, options["seed"], options["workers"], progress)
+        duration = time.perf_counter() - started
+
+        for kind, (start, end) in ranges.items():
+            if end > start:
+                self.stdout.write(f"{kind}: pk {start}..{end - 1}")
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {total} rows in {duration:.1f}s ({total / max(duration, 1e-9):.0f} rows/s)"
+        ))
@@ -0,0 +1,266 @@
+"""
+Метрики запросов в формате Prometheus.
+
+Каждый процесс копит счётчики и гистограммы в памяти, а фоновый поток
+раз в METRICS_FLUSH_INTERVAL секунд сбрасывает их снимок в файл
+METRICS_DIR/metrics-<pid>.json (не во время ответа). Представление
+/metrics складывает снимки всех воркеров gunicorn, так что метрики видны
+целиком, какой бы воркер ни обработал запрос Prometheus. Снимки умерших
+процессов удаляются: при сборке по pid, а в gunicorn - хуками on_starting
+и child_exit (gunicorn.conf.py).
+
+/metrics доступен адресам из METRICS_ALLOWED_IPS, запросам с заголовком
+"Authorization: Bearer <METRICS_TOKEN>" и сотрудникам (is_staff).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.http import HttpRequest, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .queries import QueryRecorder
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+HELP = {
+    "http_requests_total": ("counter", "Requests by route, method and status"),
+    "http_request_duration_seconds": ("histogram", "Request latency by route"),
+    "http_request_db_queries": ("histogram", "DB queries per request by route"),
+    "cache_hits_total": ("counter", "Cache hits by tier"),
+    "cache_misses_total": ("counter", "Cache misses by tier"),
+}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def _check_fork(self):
+        # после fork мастера gunicorn воркер не должен повторно отдавать его счётчики
+        if self.pid != os.getpid():
+            self.reset()
+        # потоки не переживают fork, поэтому поток сброса запускается в каждом процессе
+        if self._flusher_pid != self.pid:
+            self._flusher_pid = self.pid
+            threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True).start()
+
+    def _flush_periodically(self):
+        pid = os.getpid()
+        while pid == os.getpid():
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("Could not write metrics snapshot")
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            self.counters[key] += value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    "buckets": list(buckets),
+                    "counts": [0] * len(buckets),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram["counts"][index] += 1
+                    break
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._check_fork()
+            snapshot = {
+                "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, labels, dict(h, counts=list(h["counts"]))]
+                               for (name, labels), h in self.histograms.items()],
+            }
+        # счётчики кэша уже накоплены самим бэкендом, их достаточно переписать
+        stats = getattr(caches["default"], "stats", None)
+        if stats is not None:
+            for tier, values in stats().items():
+                snapshot["counters"].append(["cache_hits_total", [["tier", tier]], values["hits"]])
+                snapshot["counters"].append(["cache_misses_total", [["tier", tier]], values["misses"]])
+        return snapshot
+
+    def flush(self):
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = snapshot_path(directory, os.getpid())
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+
+
+def snapshot_path(directory: Path, pid: int) -> Path:
+    return directory / f"metrics-{pid}.json"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # процесс есть, но чужой
+    return True
+
+
+class MetricsMiddleware:
+    """
+    Замеряет время ответа, статус и число запросов к БД для каждого
+    маршрута (по имени url). Ставится первым в MIDDLEWARE.
+    """
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with QueryRecorder(fingerprints=False) as queries:
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        started = time.perf_counter()
+        with QueryRecorder(fingerprints=False) as queries:
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    def record(self, request: HttpRequest, response, duration, queries: QueryRecorder):
+        match = request.resolver_match
+        route = match.view_name if match else "unmatched"
+        registry.inc("http_requests_total", {
+            "route": route,
+            "method": request.method,
+            "status": str(response.status_code),
+        })
+        registry.observe("http_request_duration_seconds", {"route": route}, duration, LATENCY_BUCKETS)
+        registry.observe("http_request_db_queries", {"route": route}, queries.count, QUERY_BUCKETS)
+
+
+def _merge_snapshots(directory: Path):
+    counters = defaultdict(float)
+    histograms = {}
+    for path in directory.glob("metrics-*.json"):
+        pid = path.stem.partition("-")[2]
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            # воркер умер, его счётчики больше не растут
+            path.unlink(missing_ok=True)
+            continue
+        try:
+            snapshot = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in snapshot["counters"]:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, histogram in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, dict(histogram, counts=[0] * len(histogram["counts"]),
+                                                     sum=0.0, count=0))
+            merged["counts"] = [a + b for a, b in zip(merged["counts"], histogram["counts"])]
+            merged["sum"] += histogram["sum"]
+            merged["count"] += histogram["count"]
+    return counters, histograms
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_number(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_metrics() -> str:
+    counters, histograms = _merge_snapshots(Path(settings.METRICS_DIR))
+    lines = []
+    described = set()
+
+    def describe(name):
+        if name not in described:
+            described.add(name)
+            kind, help_text = HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name)
+        lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+
+    for (name, labels), histogram in sorted(histograms.items()):
+        describe(name)
+        cumulative = 0
+        for bound, count in zip(histogram["buckets"], histogram["counts"]):
+            cumulative += count
+            bucket_labels = labels + (("le", _format_number(bound)),)
+            lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(histogram['sum'])}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _metrics_allowed(request: HttpRequest) -> bool:
+    if request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+    if token and constant_time_compare(authorization, f"Bearer {token}"):
+        return True
+    user = getattr(request, "user", None)
+    return user is not None and user.is_staff
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    if not _metrics_allowed(request):
+        raise PermissionDenied
+    registry.flush()
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
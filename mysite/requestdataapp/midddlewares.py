@@ -1,57 +1,105 @@
+import logging
+import math
 import time
 
-
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
 from django.http import HttpRequest, HttpResponse
+from django.utils import translation
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
 
 
+@sync_and_async_middleware
 def set_useragent_on_request_middleware(get_response):
-    print("initial call")
 
-    def middleware(request: HttpRequest):
-        print("before get response")
-        request.user_agent = request.META["HTTP_USER_AGENT"]
-        response = get_response(request)
-        print("after get response")
-        return response
+    if iscoroutinefunction(get_response):
+        async def middleware(request: HttpRequest):
+            request.user_agent = request.META["HTTP_USER_AGENT"]
+            return await get_response(request)
+    else:
+        def middleware(request: HttpRequest):
+            request.user_agent = request.META["HTTP_USER_AGENT"]
+            return get_response(request)
 
     return middleware
 
 
-class CountRequestMiddleware:
+class RateLimitMiddleware:
+    """
+    Ограничение частоты запросов с одного IP по скользящему окну.
+
+    На каждого активного клиента в кэше лежат два счётчика (текущее и
+    предыдущее окно) с TTL в два окна, так что неактивные клиенты
+    вытесняются сами. Кэш (settings.RATE_LIMIT_CACHE) общий для всех
+    воркеров, поэтому лимит не умножается на их количество. Его incr()
+    должен быть атомарным (Redis, mysite.cache.LockedFileCache), иначе
+    параллельные запросы теряют приращения.
+
+    Лимиты задаются по префиксу пути (без языкового префикса i18n)
+    в settings.RATE_LIMITS: (область, префикс, запросов, секунд);
+    срабатывает первое совпадение.
+
+    Под ASGI проверка идёт одним вызовом sync_to_async: кэш блокирующий,
+    но поток занят только на время работы со счётчиками.
+    """
+    sync_capable = async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
-        self.request_count = 0
-        self.response_count = 0
-        self.exception_count = 0
-        self.user_call = {}
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def get_rule(self, request: HttpRequest):
+        path = request.path_info
+        language = translation.get_language_from_path(path)
+        if language:
+            path = path[len(language) + 1:]
+        for rule in settings.RATE_LIMITS:
+            if path.startswith(rule[1]):
+                return rule
+        return None
 
     def __call__(self, request: HttpRequest):
-        self.request_count += 1
-        print("request count", self.request_count)
-        ip = request.META["REMOTE_ADDR"]
-        """добавление нового ip пользователя со временем последнего ответа и количеством запросов"""
-        if ip not in self.user_call:
-            response = self.get_response(request)
-            self.response_count += 1
-            print("response count", self.response_count)
-            self.user_call[ip] = [time.time()] + [0]
-            return response
-        """ Обнуление количества запросов пользователя """
-        if self.user_call[ip][0] < time.time() - 2:
-            self.user_call[ip][1] = 0
-        """ Ограничение по количеству запросов"""
-        if self.user_call[ip][1] <= 3:
-            response = self.get_response(request)
-            self.response_count += 1
-            print("response count", self.response_count)
-            self.user_call[ip][0] = time.time()
-            self.user_call[ip][1] += 1
-            return response
-        else:
-            self.exception_count += 1
-            return HttpResponse("Too many requests, hold on for a while", status=429)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        rule = self.get_rule(request) if settings.RATE_LIMIT_ENABLED else None
+        rejected = self.check(request, rule) if rule else None
+        return self.get_response(request) if rejected is None else rejected
 
-    def process_exception(self, request: HttpRequest, exception: Exception):
-        self.exception_count += 1
-        print("got", self.exception_count, "exceptions")
+    async def __acall__(self, request: HttpRequest):
+        rule = self.get_rule(request) if settings.RATE_LIMIT_ENABLED else None
+        rejected = await sync_to_async(self.check)(request, rule) if rule else None
+        return await self.get_response(request) if rejected is None else rejected
 
+    def check(self, request: HttpRequest, rule):
+        """
+        Учитывает запрос; ответ 429, если лимит превышен, иначе None.
+        """
+        scope, _, limit, period = rule
+        client = request.META.get("REMOTE_ADDR", "")
+        now = time.time()
+        window, elapsed = divmod(now, period)
+        key = f"ratelimit:{scope}:{client}:{int(window)}"
+        previous_key = f"ratelimit:{scope}:{client}:{int(window) - 1}"
+
+        cache = caches[settings.RATE_LIMIT_CACHE]
+        cache.add(key, 0, period * 2)
+        try:
+            current = cache.incr(key)
+        except ValueError:
+            # ключ успел истечь между add и incr
+            cache.set(key, 1, period * 2)
+            current = 1
+        previous = cache.get(previous_key, 0)
+
+        # запросы прошлого окна учитываются пропорционально его доле в скользящем окне
+        estimated = previous * (1 - elapsed / period) + current
+        if estimated > limit:
+            logger.warning("Rate limit %s exceeded by %s", scope, client)
+            response = HttpResponse("Too many requests, hold on for a while", status=429)
+            response["Retry-After"] = str(math.ceil(period - elapsed))
+            return response
+        return None
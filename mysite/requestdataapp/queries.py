@@ -0,0 +1,264 @@
+"""
+Учёт SQL-запросов на запрос и поиск N+1.
+
+QueryRecorder считает запросы и группирует их по "отпечатку" - тексту
+SQL без значений. Много запросов с одним отпечатком за один HTTP-запрос
+почти всегда означает N+1 (ленивый FK или related-менеджер в цикле).
+
+Активные QueryRecorder лежат в contextvar, а на каждом соединении стоит
+один execute_wrapper, который их находит. Контекст переходит в потоки
+sync_to_async, поэтому в асинхронных view учитываются и запросы, которые
+ORM выполняет в отдельном потоке со своим соединением.
+"""
+import logging
+import math
+import re
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:%s|\?|'[^']*'|-?\d+(?:\.\d+)?)\s*,?)+\)", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(sql: str) -> str:
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    return _SPACES.sub(" ", sql).strip().replace("%s", "?")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+_recorders = ContextVar("query_recorders", default=())
+
+
+def _record_queries(execute, sql, params, many, context):
+    alias = context["connection"].alias
+    for recorder in _recorders.get():
+        if recorder.using == alias:
+            recorder.record(sql)
+    return execute(sql, params, many, context)
+
+
+def _install_recorder(connection, **kwargs):
+    if _record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_queries)
+
+
+# соединения потоков sync_to_async создаются уже во время запроса
+connection_created.connect(_install_recorder)
+
+
+class QueryRecorder:
+    """
+    Контекстный менеджер: считает запросы к БД внутри блока, в том числе
+    из потоков sync_to_async внутри асинхронного кода.
+
+        with QueryRecorder() as recorder:
+            ...
+        recorder.count, recorder.repeated(5)
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, fingerprints=True):
+        self.using = using
+        self.fingerprints = fingerprints
+        self.count = 0
+        self.shapes = Counter()
+        self._token = None
+
+    def record(self, sql):
+        self.count += 1
+        if self.fingerprints:
+            self.shapes[fingerprint(sql)] += 1
+
+    def __enter__(self):
+        # соединение этого потока могло открыться до подключения сигнала
+        _install_recorder(connections[self.using])
+        self._token = _recorders.set(_recorders.get() + (self,))
+        return self
+
+    def __exit__(self, *exc_info):
+        _recorders.reset(self._token)
+
+    def repeated(self, threshold: int) -> list:
+        """
+        Отпечатки, которые встретились не меньше threshold раз.
+        """
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def problems(self, budget, repeat_threshold) -> list:
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(f"{self.count} queries, budget is {budget}")
+        for shape, count in self.repeated(repeat_threshold):
+            problems.append(f"possible N+1, {count} x {shape}")
+        return problems
+
+
+class QueryBudgetMiddleware:
+    """
+    Пишет в лог (или бросает QueryBudgetExceeded при QUERY_BUDGET_RAISE)
+    запросы, которые превысили бюджет запросов к БД или повторили один
+    и тот же SQL не меньше QUERY_REPEAT_THRESHOLD раз.
+    Бюджет по умолчанию - QUERY_BUDGET, для отдельных url - QUERY_BUDGETS.
+    Работает только при QUERY_BUDGET_ENABLED (по умолчанию - под DEBUG).
+    """
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_BUDGET_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    def check(self, request: HttpRequest, recorder: QueryRecorder):
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        budget = settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET)
+        problems = recorder.problems(budget, settings.QUERY_REPEAT_THRESHOLD)
+        if problems:
+            message = f"{request.method} {request.path} ({view_name}): " + "; ".join(problems)
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+
+class QueryBudgetTestMixin:
+    """
+    Для TestCase: бюджеты запросов по имени url.
+
+        query_budgets = {
+            "shopapp:order_list": 4,
+            ("shopapp:orders_detail", 1): 4,  # имя url и позиционные аргументы
+        }
+
+    test_query_budgets запрашивает каждый url и падает, если запросов
+    больше бюджета или найден повторяющийся запрос (N+1).
+    """
+    query_budgets = {}
+    query_repeat_threshold = 3
+
+    def assertQueryBudget(self, url, budget, data=None):
+        with QueryRecorder() as recorder:
+            response = self.client.get(url, data, HTTP_USER_AGENT="Mozilla/5.0")
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400, f"{url} returned {response.status_code}")
+        problems = recorder.problems(budget, self.query_repeat_threshold)
+        self.assertFalse(problems, f"{url}: " + "; ".join(problems))
+        return recorder
+
+    def test_query_budgets(self):
+        from django.urls import reverse
+
+        for name, budget in self.query_budgets.items():
+            name, *args = name if isinstance(name, tuple) else (name,)
+            with self.subTest(url_name=name):
+                self.assertQueryBudget(reverse(name, args=args), budget)
+
+
+class QueryCountTestMixin:
+    """
+    Для TestCase: точное число запросов по имени url, которое не должно
+    зависеть от объёма данных.
+
+        query_counts = {
+            "shopapp:order_list": 4,
+            ("shopapp:orders_detail", 1): 4,  # имя url и позиционные аргументы
+        }
+
+    Каждый url запрашивается на маленьком наборе данных (small_counts), потом
+    на большом (к нему досеиваются large_counts), и в обоих случаях число
+    запросов должно совпасть с query_counts. Рост на большом наборе - N+1.
+    Запросы идут от суперпользователя и без кэша.
+
+    Выгрузки, которые идут кусками по KEYSET_CHUNK_SIZE, законно делают
+    запросы на каждый кусок. Для них в chunk_query_counts указывается, по
+    каким строкам идут куски и сколько запросов стоит один кусок:
+
+        chunk_query_counts = {"shopapp:orders_export": ("orders", 2)}
+
+    Большой набор больше одного куска, так что рост сверх этого ловится.
+    """
+    query_counts = {}
+    chunk_query_counts = {}
+    small_counts = {"users": 10, "products": 10, "orders": 10, "articles": 10}
+    large_counts = {"users": 100, "products": 1500, "orders": 1500, "articles": 290}
+
+    @classmethod
+    def setUpTestData(cls):
+        from requestdataapp.seed import seed
+
+        super().setUpTestData()
+        seed(cls.small_counts)
+        cls.user = User.objects.create_superuser(username="query-counts", password=None)
+
+    def measure_query_counts(self) -> dict:
+        from django.urls import reverse
+
+        counts = {}
+        for name in self.query_counts:
+            url_name, *args = name if isinstance(name, tuple) else (name,)
+            with QueryRecorder(fingerprints=False) as recorder:
+                response = self.client.get(reverse(url_name, args=args), HTTP_USER_AGENT="Mozilla/5.0")
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            self.assertLess(response.status_code, 400, f"{url_name} returned {response.status_code}")
+            counts[name] = recorder.count
+        return counts
+
+    def test_query_counts_do_not_depend_on_rows(self):
+        from django.test import override_settings
+        from requestdataapp.seed import seed
+
+        dummy = {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+        self.client.force_login(self.user)
+        with override_settings(CACHES={"default": dummy, "ratelimit": dummy}, RATE_LIMIT_ENABLED=False):
+            small = self.measure_query_counts()
+            seed(self.large_counts)
+            large = self.measure_query_counts()
+        for name, expected in self.query_counts.items():
+            with self.subTest(url=name):
+                self.assertEqual((small[name], large[name]), (expected, expected + self.extra_chunk_queries(name)))
+
+    def extra_chunk_queries(self, name) -> int:
+        """
+        Запросы за куски выгрузки сверх первого на большом наборе.
+        """
+        from shopapp.common import KEYSET_CHUNK_SIZE
+
+        if name not in self.chunk_query_counts:
+            return 0
+        kind, per_chunk = self.chunk_query_counts[name]
+        rows = self.small_counts[kind] + self.large_counts[kind]
+        self.assertGreater(rows, KEYSET_CHUNK_SIZE, "the large set must span more than one chunk")
+        return per_chunk * (math.ceil(rows / KEYSET_CHUNK_SIZE) - 1)
@@ -0,0 +1,220 @@
+"""
+Генератор синтетических данных для нагрузочных тестов.
+
+Строки пишутся пачками через bulk_create с явными pk. Каждый тип данных
+делится на куски по SEED_CHUNK_SIZE pk, у каждого куска свой генератор
+случайных чисел от (random_seed, тип, начало куска), поэтому результат не
+зависит от числа процессов: куски с непересекающимися диапазонами pk
+можно писать параллельно. Новые строки добавляются после MAX(pk), так что
+команду можно запускать и на непустой базе.
+"""
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min
+
+from blogapp.models import Article, Author, Category, Tag
+from mysite.changes import touch_change_stamp
+from myauth.models import Profile
+from shopapp.models import Product, Order
+
+SEED_CHUNK_SIZE = 10000
+SEED_BATCH_SIZE = 5000
+
+FIRST_NAMES = ("Ivan", "Anna", "Petr", "Olga", "Igor", "Maria", "Sergey", "Elena", "Oleg", "Nina")
+LAST_NAMES = ("Ivanov", "Petrova", "Sidorov", "Smirnova", "Kuznetsov", "Popova", "Volkov", "Sokolova")
+STREETS = ("Lenina", "Mira", "Sadovaya", "Gagarina", "Pushkina", "Sovetskaya", "Lesnaya", "Ivankovo")
+WORDS = (
+    "steel", "wooden", "smart", "compact", "classic", "wireless", "laptop", "phone",
+    "chair", "table", "lamp", "kettle", "camera", "speaker", "watch", "bag",
+    "red", "black", "mini", "pro", "home", "travel", "kids", "office",
+)
+
+
+def counts_for_scale(scale: int) -> dict:
+    return {
+        "users": max(10, scale // 100),
+        "products": scale,
+        "orders": scale,
+        "articles": max(10, scale // 10),
+    }
+
+
+def _text(rnd, words):
+    return " ".join(rnd.choice(WORDS) for _ in range(words))
+
+
+def _skewed(rnd, first, last, power=2.5):
+    # первые pk выбираются намного чаще: популярные товары и активные покупатели
+    return first + int((last - first + 1) * rnd.random() ** power)
+
+
+def _users(rnd, start, end, context):
+    users, profiles = [], []
+    for pk in range(start, end):
+        first_name, last_name = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+        users.append(User(
+            pk=pk,
+            username=f"user{pk}",
+            first_name=first_name,
+            last_name=last_name,
+            email=f"user{pk}@example.com",
+            password=context["password"],
+        ))
+        profiles.append(Profile(
+            user_id=pk,
+            bio=_text(rnd, rnd.randint(0, 20)),
+            agreement_accepted=rnd.random() < 0.8,
+        ))
+    User.objects.bulk_create(users, batch_size=SEED_BATCH_SIZE)
+    Profile.objects.bulk_create(profiles, batch_size=SEED_BATCH_SIZE)
+
+
+def _products(rnd, start, end, context):
+    users = context["users"]
+    Product.objects.bulk_create(
+        [
+            Product(
+                pk=pk,
+                name=_text(rnd, rnd.randint(1, 4)),
+                descriptions=_text(rnd, rnd.randint(0, 40)),
+                # цены распределены логнормально: много дешёвых, немного дорогих
+                price=min(999999.99, round(rnd.lognormvariate(8.5, 1.0)) / 100),
+                discount=rnd.choices((0, 5, 10, 15, 25, 50), weights=(70, 10, 8, 5, 5, 2))[0],
+                created_by_id=rnd.randint(*users),
+                archived=rnd.random() < 0.05,
+            )
+            for pk in range(start, end)
+        ],
+        batch_size=SEED_BATCH_SIZE,
+    )
+
+
+def _orders(rnd, start, end, context):
+    users, products = context["users"], context["products"]
+    orders, items = [], []
+    for pk in range(start, end):
+        orders.append(Order(
+            pk=pk,
+            delivery_address=f"ul {rnd.choice(STREETS)}, d {rnd.randint(1, 200)}, kv {rnd.randint(1, 300)}",
+            promocode="SALE10" if rnd.random() < 0.1 else "",
+            user_id=_skewed(rnd, *users),
+        ))
+        size = min(10, 1 + int(rnd.expovariate(0.7)))
+        for product_pk in {_skewed(rnd, *products) for _ in range(size)}:
+            items.append(Order.products.through(order_id=pk, product_id=product_pk))
+    Order.objects.bulk_create(orders, batch_size=SEED_BATCH_SIZE)
+    Order.products.through.objects.bulk_create(items, batch_size=SEED_BATCH_SIZE)
+
+
+def _articles(rnd, start, end, context):
+    authors, categories, tags = context["authors"], context["categories"], context["tags"]
+    articles, article_tags = [], []
+    for pk in range(start, end):
+        articles.append(Article(
+            pk=pk,
+            title=_text(rnd, rnd.randint(2, 8)).capitalize(),
+            content=_text(rnd, rnd.randint(50, 300)),
+            author_id=authors[min(len(authors) - 1, int(len(authors) * rnd.random() ** 2))],
+            category_id=rnd.choice(categories),
+        ))
+        for tag_pk in rnd.sample(tags, rnd.randint(0, 4)):
+            article_tags.append(Article.tags.through(article_id=pk, tag_id=tag_pk))
+    Article.objects.bulk_create(articles, batch_size=SEED_BATCH_SIZE)
+    Article.tags.through.objects.bulk_create(article_tags, batch_size=SEED_BATCH_SIZE)
+
+
+# порядок важен: заказы ссылаются на пользователей и товары
+GENERATORS = {
+    "users": (User, _users),
+    "products": (Product, _products),
+    "orders": (Order, _orders),
+    "articles": (Article, _articles),
+}
+
+
+def _seed_chunk(task):
+    kind, random_seed, start, end, context = task
+    rnd = random.Random(f"{random_seed}:{kind}:{start}")
+    with transaction.atomic():
+        GENERATORS[kind][1](rnd, start, end, context)
+    return kind, end - start
+
+
+def _ensure_named(model, prefix, count) -> list:
+    existing = list(model.objects.order_by("pk").values_list("pk", flat=True)[:count])
+    if len(existing) < count:
+        model.objects.bulk_create([model(name=f"{prefix}{i}") for i in range(len(existing), count)])
+        existing = list(model.objects.order_by("pk").values_list("pk", flat=True)[:count])
+    return existing
+
+
+def _next_pk(model) -> int:
+    return (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+
+
+def _fk_range(model, new_range) -> tuple:
+    # ссылаемся на только что созданные строки: их pk идут без пропусков
+    start, end = new_range
+    if end > start:
+        return start, end - 1
+    bounds = model.objects.aggregate(first=Min("pk"), last=Max("pk"))
+    if bounds["first"] is None:
+        raise ValueError(f"No {model._meta.verbose_name_plural} to reference, seed them first")
+    return bounds["first"], bounds["last"]
+
+
+def seed(counts: dict, random_seed: int = 0, workers: int = 1, progress=None) -> dict:
+    """
+    Добавляет строки в количестве counts ({"users": ..., "products": ...,
+    "orders": ..., "articles": ...}). Возвращает диапазоны pk по типам.
+    progress(kind, rows) вызывается после каждого куска.
+    """
+    context = {
+        "password": make_password(None),
+        "authors": _ensure_named(Author, "author", 50),
+        "categories": _ensure_named(Category, "category", 20),
+        "tags": _ensure_named(Tag, "tag", 100),
+    }
+    ranges = {}
+    for kind, (model, _) in GENERATORS.items():
+        start = _next_pk(model)
+        ranges[kind] = (start, start + counts.get(kind, 0))
+    if counts.get("products") or counts.get("orders"):
+        context["users"] = _fk_range(User, ranges["users"])
+    if counts.get("orders"):
+        context["products"] = _fk_range(Product, ranges["products"])
+
+    # SQLite пишет в один поток: параллельные процессы только ждали бы блокировку
+    if connection.vendor == "sqlite":
+        workers = 1
+    pool = None
+    if workers > 1:
+        connections.close_all()  # дочерние процессы откроют свои соединения
+        pool = ProcessPoolExecutor(workers)
+    try:
+        for kind, (start, end) in ranges.items():
+            tasks = [
+                (kind, random_seed, chunk, min(chunk + SEED_CHUNK_SIZE, end), context)
+                for chunk in range(start, end, SEED_CHUNK_SIZE)
+            ]
+            results = pool.map(_seed_chunk, tasks) if pool else map(_seed_chunk, tasks)
+            for done_kind, rows in results:
+                if progress:
+                    progress(done_kind, rows)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    # pk заданы явно, последовательности PostgreSQL нужно сдвинуть
+    models = [model for model, _ in GENERATORS.values()]
+    models += [Profile, Order.products.through, Article.tags.through]
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+    touch_change_stamp(*(model for model, _ in GENERATORS.values()), Author, Category, Tag, Article.tags.through)
+    return ranges
@@ -1,3 +1,288 @@
-from django.test import TestCase
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from django.urls import reverse
+
+from requestdataapp.bench import ENDPOINTS, compare, parse_scale, run_endpoint, run_serializer, seed_bench
+from requestdataapp.metrics import registry
+from requestdataapp.midddlewares import RateLimitMiddleware
+from requestdataapp.queries import QueryBudgetMiddleware, QueryBudgetExceeded, fingerprint
+from requestdataapp.seed import seed
+from shopapp.models import Order
+
+
+@override_settings(
+    CACHES={"ratelimit": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    RATE_LIMIT_CACHE="ratelimit",
+    RATE_LIMITS=[
+        ("api", "/shop/api/", 3, 10),
+        ("html", "/", 5, 10),
+    ],
+)
+class RateLimitMiddlewareTestCase(SimpleTestCase):
+
+    def setUp(self):
+        caches["ratelimit"].clear()
+        self.factory = RequestFactory()
+        self.middleware = RateLimitMiddleware(lambda request: HttpResponse("ok"))
+
+    def get(self, path, ip="10.0.0.1"):
+        return self.middleware(self.factory.get(path, REMOTE_ADDR=ip))
+
+    @mock.patch("requestdataapp.midddlewares.time.time", return_value=1000.0)
+    def test_limit_per_prefix_and_client(self, _):
+        statuses = [self.get("/en/shop/api/products/").status_code for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+        self.assertEqual(self.get("/en/shop/products/").status_code, 200)
+        self.assertEqual(self.get("/en/shop/api/products/", ip="10.0.0.2").status_code, 200)
+
+    @mock.patch("requestdataapp.midddlewares.time.time", return_value=1000.0)
+    def test_async_limit(self, _):
+        async def view(request):
+            return HttpResponse("ok")
+
+        middleware = RateLimitMiddleware(view)
+        statuses = [
+            async_to_sync(middleware)(self.factory.get("/shop/api/", REMOTE_ADDR="10.0.0.3")).status_code
+            for _ in range(4)
+        ]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+    def test_previous_window_is_weighted(self):
+        with mock.patch("requestdataapp.midddlewares.time.time", return_value=1009.0):
+            for _ in range(3):
+                self.get("/shop/api/")
+        # через 5 секунд нового окна от прошлых 3 запросов остаётся половина
+        with mock.patch("requestdataapp.midddlewares.time.time", return_value=1015.0):
+            responses = [self.get("/shop/api/") for _ in range(3)]
+        self.assertEqual([response.status_code for response in responses], [200, 429, 429])
+        self.assertEqual(responses[-1]["Retry-After"], "5")
+
+
+class LockedFileCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.override = override_settings(CACHES={
+            "ratelimit": {"BACKEND": "mysite.cache.LockedFileCache", "LOCATION": self.location},
+        })
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+
+    def test_concurrent_increments_are_not_lost(self):
+        cache = caches["ratelimit"]
+        cache.add("counter", 0, 60)
+
+        def increment():
+            # отдельный экземпляр на поток, как в разных воркерах
+            worker = caches.create_connection("ratelimit")
+            for _ in range(50):
+                worker.incr("counter")
+
+        threads = [threading.Thread(target=increment) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.get("counter"), 200)
+        self.assertFalse(cache.add("counter", 0, 60))
+
+    def test_incr_keeps_expiry_and_prune_removes_expired(self):
+        cache = caches["ratelimit"]
+        cache.add("old", 1, 1)
+        cache.add("fresh", 1, 60)
+        with mock.patch("mysite.cache.time.time", return_value=time.time() + 2):
+            with self.assertRaises(ValueError):
+                cache.incr("old")
+            call_command("prune_cache", stdout=StringIO())
+        self.assertEqual(os.listdir(self.location), [os.path.basename(cache._key_to_file("fresh"))])
+
+    def test_writes_prune_expired_entries(self):
+        cache = caches.create_connection("ratelimit")
+        cache._prune_every = 3
+        cache.add("old", 1, 1)
+        with mock.patch("mysite.cache.time.time", return_value=time.time() + 2):
+            cache.add("new", 1, 60)
+            self.assertEqual(len(os.listdir(self.location)), 2)
+            cache.set("newer", 1, 60)
+        self.assertNotIn(os.path.basename(cache._key_to_file("old")), os.listdir(self.location))
+        self.assertEqual(len(os.listdir(self.location)), 2)
+
+
+class MetricsEndpointTestCase(TestCase):
+
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(METRICS_DIR=self.metrics_dir)
+        self.settings_override.enable()
+        registry.reset()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+    def test_metrics_are_aggregated_across_workers(self):
+        self.client.get(reverse("myauth:hello"), HTTP_USER_AGENT="Mozilla/5.0")
+        # снимок другого воркера
+        with open(f"{self.metrics_dir}/metrics-1.json", "w") as snapshot:
+            snapshot.write(
+                '{"counters": [["http_requests_total", '
+                '[["method", "GET"], ["route", "myauth:hello"], ["status", "200"]], 2]], '
+                '"histograms": []}'
+            )
+
+        response = self.client.get(reverse("metrics"), HTTP_USER_AGENT="Mozilla/5.0")
+        body = response.content.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_requests_total{method="GET",route="myauth:hello",status="200"} 3', body)
+        self.assertIn('http_request_duration_seconds_count{route="myauth:hello"} 1', body)
+        self.assertIn('http_request_db_queries_bucket{route="myauth:hello",le="+Inf"} 1', body)
+        self.assertIn("# TYPE http_request_duration_seconds histogram", body)
+
+    def test_snapshots_of_dead_workers_are_dropped(self):
+        process = subprocess.Popen(["true"])
+        process.wait()
+        dead = f"{self.metrics_dir}/metrics-{process.pid}.json"
+        with open(dead, "w") as snapshot:
+            snapshot.write('{"counters": [["http_requests_total", [["route", "dead"]], 5]], "histograms": []}')
+
+        body = self.client.get(reverse("metrics"), HTTP_USER_AGENT="Mozilla/5.0").content.decode()
+        self.assertNotIn('route="dead"', body)
+        self.assertFalse(os.path.exists(dead))
+
+    @override_settings(METRICS_ALLOWED_IPS=["10.0.0.1"], METRICS_TOKEN="secret")
+    def test_access_is_restricted(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url, HTTP_USER_AGENT="Mozilla/5.0").status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_USER_AGENT="Mozilla/5.0",
+                                         HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_USER_AGENT="Mozilla/5.0",
+                                         HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_USER_AGENT="Mozilla/5.0",
+                                         REMOTE_ADDR="10.0.0.1").status_code, 200)
+
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+        self.assertEqual(self.client.get(url, HTTP_USER_AGENT="Mozilla/5.0").status_code, 200)
+
+
+class QueryBudgetTestCase(TestCase):
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 15 AND name = 'x' AND pk IN (1, 2, 3)"),
+            fingerprint("SELECT  * FROM t WHERE id = 7 AND name = 'y''z' AND pk IN (4)"),
+        )
+
+    def test_repeated_queries_are_reported(self):
+        def view(request):
+            for pk in range(5):
+                list(User.objects.filter(pk=pk))
+            return HttpResponse("ok")
+
+        request = RequestFactory().get("/")
+        request.resolver_match = None
+        with override_settings(QUERY_BUDGET_ENABLED=True):
+            middleware = QueryBudgetMiddleware(view)
+        with override_settings(QUERY_BUDGET=10, QUERY_REPEAT_THRESHOLD=5):
+            with self.assertLogs("requestdataapp.queries", "WARNING") as logs:
+                middleware(request)
+        self.assertIn("possible N+1, 5 x", logs.output[0])
+
+        with override_settings(QUERY_BUDGET=3, QUERY_REPEAT_THRESHOLD=10, QUERY_BUDGET_RAISE=True):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "5 queries, budget is 3"):
+                middleware(request)
+
+    @override_settings(QUERY_BUDGET_ENABLED=False)
+    def test_disabled_middleware_is_not_installed(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryBudgetMiddleware(lambda request: HttpResponse("ok"))
+
+    def test_async_view_queries_from_orm_threads_are_counted(self):
+        async def view(request):
+            for pk in range(5):
+                # отдельный поток со своим соединением, как под ASGI
+                await sync_to_async(list, thread_sensitive=False)(User.objects.filter(pk=pk))
+            return HttpResponse("ok")
+
+        request = RequestFactory().get("/")
+        request.resolver_match = None
+        with override_settings(QUERY_BUDGET_ENABLED=True):
+            middleware = QueryBudgetMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with override_settings(QUERY_BUDGET=10, QUERY_REPEAT_THRESHOLD=5):
+            with self.assertLogs("requestdataapp.queries", "WARNING") as logs:
+                async_to_sync(middleware)(request)
+        self.assertIn("possible N+1, 5 x", logs.output[0])
+
+    @override_settings(DEBUG=True, QUERY_BUDGET_ENABLED=True)
+    def test_middleware_chain_stays_async_under_asgi(self):
+        middleware = [name for name in settings.MIDDLEWARE if not name.startswith("debug_toolbar.")]
+        with override_settings(MIDDLEWARE=middleware), self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler().load_middleware(is_async=True)
+
+
+class BenchTestCase(TestCase):
+
+    def test_parse_scale(self):
+        self.assertEqual([parse_scale(v) for v in ("1k", "100K", "1m", "250")], [1000, 100000, 1000000, 250])
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_seed_and_run(self):
+        rows = seed_bench(30, 1)
+        self.assertEqual(Order.objects.count(), rows["orders"])
+
+        endpoint = next(e for e in ENDPOINTS if e.name == "api_products")
+        result = run_endpoint(endpoint, 3)
+        self.assertEqual(result["status"], 200)
+        self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+
+        slower = dict(result, p95_ms=result["p95_ms"] * 3 + 1, queries=result["queries"] + 1)
+        lines, regressions = compare({"endpoints": {"api_products": slower}},
+                                     {"endpoints": {"api_products": result}}, threshold=50)
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(len(regressions), 2)
+
+        result = run_serializer("orders", 20, 2)
+        self.assertEqual(result["rows"], 20)
+        self.assertGreater(result["after_rows_per_s"], 0)
+
+
+class SeedTestCase(TestCase):
+    counts = {"users": 5, "products": 40, "orders": 30, "articles": 10}
+
+    def order_items(self):
+        return list(Order.products.through.objects.values_list("order_id", "product_id").order_by("pk"))
+
+    def test_seed_is_deterministic(self):
+        with transaction.atomic():
+            seed(self.counts, random_seed=7)
+            first = self.order_items()
+            transaction.set_rollback(True)
+        seed(self.counts, random_seed=7)
+        self.assertTrue(first)
+        self.assertEqual(self.order_items(), first)
+
+    def test_seed_appends_after_existing_rows(self):
+        seed(self.counts, random_seed=7)
+        ranges = seed({"orders": 10}, random_seed=7)
+        self.assertEqual(ranges["orders"], (31, 41))
+        self.assertEqual(Order.objects.count(), 40)
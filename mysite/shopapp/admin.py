@@ -3,9 +3,12 @@ from django.db.models import QuerySet
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render, redirect
 from django.urls import path
+from django.utils import timezone
 
-from .common import save_csv_produts, save_csv_orders
-from .models import Product, Order, ProductImages
+from mysite.changes import touch_change_stamp
+
+from .jobs import enqueue_job, job_status
+from .models import Product, Order, ProductImages, Job
 from .admin_mixins import ExportAsCSVMixin
 from .forms import CSVImportForm
 
@@ -20,12 +23,15 @@ class ProductInline(admin.StackedInline):
 
 @admin.action(description="Archive product")
 def mark_archived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
-    queryset.update(archived=True)
+    # update() не шлёт сигналов и не трогает auto_now
+    queryset.update(archived=True, updated_at=timezone.now())
+    touch_change_stamp(Product)
 
 
 @admin.action(description="Unarchive product")
 def mark_unarchived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
-    queryset.update(archived=False)
+    queryset.update(archived=False, updated_at=timezone.now())
+    touch_change_stamp(Product)
 
 
 @admin.register(Product)
@@ -36,6 +42,7 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
         mark_archived,
         mark_unarchived,
         "export_csv",
+        "export_csv_background",
     ]
     inlines = [
         OrderInline,
@@ -78,12 +85,13 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
             context = {"form": form}
             return render(request, "admin/csv-form.html", context, status=400)
 
-        save_csv_produts(
-            file=form.files["csv_file"].file,
+        job = enqueue_job(
+            Job.Kind.IMPORT_PRODUCTS,
+            source=form.files["csv_file"],
             encoding=request.encoding,
+            user=request.user,
         )
-        self.message_user(request, "Data from CSV imported successfully")
-        return redirect("..")
+        return render(request, "admin/job-status.html", {"job": job_status(job)})
 
     def get_urls(self):
         urls = super(ProductAdmin, self).get_urls()
@@ -126,12 +134,13 @@ class OrderAdmin(admin.ModelAdmin):
             context = {"form": form}
             return render(request, "admin/csv-form.html", context, status=400)
 
-        save_csv_orders(
-            file=form.files["csv_file"].file,
+        job = enqueue_job(
+            Job.Kind.IMPORT_ORDERS,
+            source=form.files["csv_file"],
             encoding=request.encoding,
+            user=request.user,
         )
-        self.message_user(request, "Data from CSV imported successfully")
-        return redirect("..")
+        return render(request, "admin/job-status.html", {"job": job_status(job)})
 
     def get_urls(self):
         urls = super(OrderAdmin, self).get_urls()
@@ -143,3 +152,14 @@ class OrderAdmin(admin.ModelAdmin):
             ),
         ]
         return new_urls + urls
+
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = "pk", "kind", "status", "processed", "succeeded", "failed", "created_by", "created_at", "finished_at"
+    list_filter = "kind", "status"
+    readonly_fields = [field.name for field in Job._meta.fields]
+
+    def has_add_permission(self, request: HttpRequest) -> bool:
+        return False
@@ -1,25 +1,36 @@
-import csv
-
 from django.db.models import QuerySet
 from django.db.models.options import Options
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, StreamingHttpResponse
+from django.shortcuts import render
+
+from .common import iter_csv_rows, csv_export_columns, CSV_EXPORT_CHUNK_SIZE
+from .jobs import enqueue_job, job_status
+from .models import Job
 
 
 class ExportAsCSVMixin:
     def export_csv(self, request: HttpRequest, queryset: QuerySet):
         meta: Options = self.model._meta
-        field_names = [field.name for field in meta.fields]
-
-        response = HttpResponse(content_type="text/csv")
+        field_names = csv_export_columns(self.model)
+
+        rows = (
+            queryset
+            .order_by("pk")
+            .values_list(*field_names)
+            .iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE)
+        )
+        response = StreamingHttpResponse(iter_csv_rows(field_names, rows), content_type="text/csv")
         response["Content-Disposition"] = f"attachment; filename={meta}-export.csv"
 
-        csv_writer = csv.writer(response)
-
-        csv_writer.writerow(field_names)
-
-        for odj in queryset:
-            csv_writer.writerow([getattr(odj, field) for field in field_names])
-
         return response
 
     export_csv.short_description = "Export as CSV"
+
+    def export_csv_background(self, request: HttpRequest, queryset: QuerySet):
+        meta: Options = self.model._meta
+        # и при "выбрать все" queryset уже отфильтрован фильтрами и поиском
+        params = {"model": meta.label_lower, "pks": list(queryset.values_list("pk", flat=True))}
+        job = enqueue_job(Job.Kind.EXPORT_CSV, params=params, user=request.user)
+        return render(request, "admin/job-status.html", {"job": job_status(job)})
+
+    export_csv_background.short_description = "Export as CSV (background)"
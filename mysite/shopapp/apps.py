@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class ShopappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shopapp'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from mysite.changes import register_change_stamp
+        from mysite.images import register_image_field
+        from . import signals  # noqa: F401
+        from .models import Product, ProductImages
+
+        register_image_field(Product, "preview")
+        register_image_field(ProductImages, "image")
+        for model in (Product, ProductImages, User):
+            register_change_stamp(model)
@@ -0,0 +1,56 @@
+"""
+Версионированные ключи кэша для данных о заказах пользователя.
+
+Вместо удаления закэшированных значений при изменении заказов
+увеличивается версия пользователя, и старые ключи просто перестают
+читаться (и со временем вытесняются). Поэтому TTL может быть большим.
+
+Сами версии читаются и увеличиваются прямо в общем кэше (L2 у
+TieredCache): после изменения заказов новая версия сразу видна всем
+воркерам, а не через интервал проверки их L1.
+"""
+import time
+
+from django.core.cache import cache
+
+USER_ORDERS_CACHE_TIMEOUT = 60 * 60 * 6
+
+
+def _version_cache():
+    return getattr(cache, "l2", cache)
+
+
+def user_orders_version_key(user_id) -> str:
+    return f"user_orders-version-{user_id}"
+
+
+def get_user_orders_version(user_id) -> int:
+    key, version_cache = user_orders_version_key(user_id), _version_cache()
+    version = version_cache.get(key)
+    if version is None:
+        # начальная версия от времени, чтобы после вытеснения ключа версии
+        # не прочитать значения, закэшированные под старыми номерами
+        version_cache.add(key, time.time_ns(), None)
+        version = version_cache.get(key)
+    return version
+
+
+async def aget_user_orders_version(user_id) -> int:
+    key, version_cache = user_orders_version_key(user_id), _version_cache()
+    version = await version_cache.aget(key)
+    if version is None:
+        await version_cache.aadd(key, time.time_ns(), None)
+        version = await version_cache.aget(key)
+    return version
+
+
+def bump_user_orders_version(*user_ids):
+    version_cache = _version_cache()
+    for user_id in set(user_ids):
+        if user_id is None:
+            continue
+        key = user_orders_version_key(user_id)
+        try:
+            version_cache.incr(key)
+        except ValueError:
+            version_cache.set(key, time.time_ns(), None)
@@ -1,50 +1,226 @@
-from csv import DictReader
+from csv import DictReader, writer
+from dataclasses import dataclass, field
 from io import TextIOWrapper
-from itertools import product
+from itertools import islice
+from timeit import default_timer
 
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+
+from mysite.changes import touch_change_stamp
+from shopapp.cache import bump_user_orders_version
 from shopapp.models import Product, Order
 
+CSV_EXPORT_CHUNK_SIZE = 2000
+CSV_IMPORT_BATCH_SIZE = 500
+KEYSET_CHUNK_SIZE = 1000
+MAX_IMPORT_ERRORS = 20
+
+
+class Echo:
+    """
+    Псевдо-буфер для csv.writer: вместо записи возвращает строку,
+    чтобы её можно было сразу отдать в StreamingHttpResponse.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_keyset_chunks(queryset, chunk_size=KEYSET_CHUNK_SIZE, since_pk=None):
+    """
+    Обходит values()-queryset кусками по условию pk > последнего pk,
+    без OFFSET. Каждая строка должна содержать ключ "pk".
+    """
+    last_pk = since_pk
+    queryset = queryset.order_by("pk")
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1]["pk"]
+
+
+async def aiter_keyset_chunks(queryset, chunk_size=KEYSET_CHUNK_SIZE, since_pk=None):
+    """
+    То же, что iter_keyset_chunks, через асинхронный ORM.
+    """
+    last_pk = since_pk
+    queryset = queryset.order_by("pk")
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = [row async for row in page[:chunk_size]]
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1]["pk"]
+
 
-def save_csv_produts(file, encoding):
+def csv_export_columns(model):
+    # attname у ForeignKey - это колонка с id ("created_by_id"),
+    # поэтому связанные объекты не подгружаются по одному на строку.
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def iter_csv_rows(header, rows):
+    csv_writer = writer(Echo())
+    yield csv_writer.writerow(header)
+    for row in rows:
+        yield csv_writer.writerow(row)
+
+
+@dataclass
+class ImportSummary:
+    ok: int = 0
+    failed: int = 0
+    duration: float = 0.0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self):
+        return {
+            "ok": self.ok,
+            "failed": self.failed,
+            "duration": round(self.duration, 3),
+            "errors": self.errors,
+        }
+
+
+def read_csv_rows(file, encoding):
+    """
+    Лениво читает загруженный CSV, возвращая пары (номер строки, словарь).
+    """
     csv_file = TextIOWrapper(
         file,
         encoding,
     )
     reader = DictReader(csv_file)
+    for row in reader:
+        yield reader.line_num, row
 
-    products = [
-        Product(**row)
-        for row in reader
-    ]
 
-    Product.objects.bulk_create(products)
-    return products
+def iter_batches(iterable, batch_size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def convert_product_row(row) -> Product:
+    product = Product(**row)
+    # created_by проверяется внешним ключом в БД, preview из CSV не грузится
+    product.clean_fields(exclude=["created_by", "preview"])
+    return product
+
+
+def import_csv_products(file, encoding, batch_size=CSV_IMPORT_BATCH_SIZE, progress=None) -> ImportSummary:
+    summary = ImportSummary()
+    started = default_timer()
+
+    for batch in iter_batches(read_csv_rows(file, encoding), batch_size):
+        products, lines = [], []
+        for line, row in batch:
+            try:
+                products.append(convert_product_row(row))
+                lines.append(line)
+            except ValidationError as exc:
+                summary.add_error(line, "; ".join(exc.messages))
+            except (TypeError, ValueError) as exc:
+                summary.add_error(line, str(exc))
+
+        if products:
+            try:
+                with transaction.atomic():
+                    Product.objects.bulk_create(products)
+            except DatabaseError as exc:
+                for line in lines:
+                    summary.add_error(line, str(exc))
+            else:
+                summary.ok += len(products)
+                touch_change_stamp(Product)
+        if progress:
+            progress(summary)
+
+    summary.duration = default_timer() - started
+    return summary
 
 
 def convert_str_to_int_list(string_data):
-    chars = ["[", "]", ","]
-    filtered_str = filter(lambda c: c not in chars, string_data)
-    list_str = "".join(filtered_str)
-    list_int = list(map(int, list_str))
-    return list_int
+    """
+    Разбирает список id товаров вида "[12,5]" в [12, 5].
+    """
+    items = string_data.strip().strip("[]").split(",")
+    return list(dict.fromkeys(int(item) for item in items if item.strip()))
 
 
-def save_csv_orders(file, encoding):
-    csv_file = TextIOWrapper(
-        file,
-        encoding,
+def convert_order_row(row):
+    order = Order(
+        delivery_address=row["delivery_address"],
+        promocode=row["promocode"],
+        user_id=int(row["user_id"]),
     )
-    reader = DictReader(csv_file)
-    orders = []
-    for row in reader:
-        order = Order(
-            delivery_address=row["delivery_address"],
-            promocode=row["promocode"],
-            user_id = row["user_id"],
+    order.clean_fields(exclude=["user", "receipt"])
+    return order, convert_str_to_int_list(row["product"])
+
+
+def import_csv_orders(file, encoding, batch_size=CSV_IMPORT_BATCH_SIZE, progress=None) -> ImportSummary:
+    summary = ImportSummary()
+    started = default_timer()
+    Through = Order.products.through
+
+    for batch in iter_batches(read_csv_rows(file, encoding), batch_size):
+        converted = []
+        for line, row in batch:
+            try:
+                converted.append((line, *convert_order_row(row)))
+            except ValidationError as exc:
+                summary.add_error(line, "; ".join(exc.messages))
+            except (KeyError, TypeError, ValueError) as exc:
+                summary.add_error(line, f"invalid value: {exc}")
+
+        user_ids = {order.user_id for _, order, _ in converted}
+        product_ids = {pk for _, _, pks in converted for pk in pks}
+        known_users = set(
+            User.objects.filter(pk__in=user_ids).order_by().values_list("pk", flat=True)
         )
-        order.save()
-        for product in convert_str_to_int_list(row["product"]):
-            order.products.add(product)
-        orders.append(order)
+        known_products = set(
+            Product.objects.filter(pk__in=product_ids).order_by().values_list("pk", flat=True)
+        )
+
+        valid = []
+        for line, order, pks in converted:
+            if order.user_id not in known_users:
+                summary.add_error(line, f"unknown user {order.user_id}")
+            elif not known_products.issuperset(pks):
+                summary.add_error(line, f"unknown products {sorted(set(pks) - known_products)}")
+            else:
+                valid.append((line, order, pks))
+        if valid:
+            try:
+                with transaction.atomic():
+                    orders = Order.objects.bulk_create([order for _, order, _ in valid])
+                    Through.objects.bulk_create(
+                        [
+                            Through(order_id=order.pk, product_id=product_id)
+                            for order, (_, _, pks) in zip(orders, valid)
+                            for product_id in pks
+                        ]
+                    )
+            except DatabaseError as exc:
+                for line, _, _ in valid:
+                    summary.add_error(line, str(exc))
+            else:
+                summary.ok += len(valid)
+                # bulk_create не шлёт сигналы, поэтому версии кэша поднимаются здесь
+                bump_user_orders_version(*(order.user_id for _, order, _ in valid))
+        if progress:
+            progress(summary)
 
-    return orders
+    summary.duration = default_timer() - started
+    return summary
@@ -0,0 +1,79 @@
+"""
+Загрузка галереи товара пачкой.
+
+Проверка, декодирование, запись файлов в хранилище и построение вариантов
+идут в пуле потоков (Pillow и запись на диск отпускают GIL), а строки
+ProductImages потом вставляются одним bulk_create. В потоках нет обращений
+к БД, поэтому им не нужны свои соединения.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.exceptions import ValidationError
+from django.forms import ImageField
+from PIL import Image, UnidentifiedImageError
+
+from mysite.changes import touch_change_stamp
+from mysite.images import build_variants, delete_variants
+from .models import Product, ProductImages
+
+GALLERY_UPLOAD_WORKERS = 8
+
+
+def _invalid_image(upload) -> ValidationError:
+    return ValidationError(
+        ImageField.default_error_messages["invalid_image"] + " (%(name)s)",
+        code="invalid_image",
+        params={"name": upload.name},
+    )
+
+
+def _store_image(instance: ProductImages, upload):
+    """
+    Возвращает (имя сохранённого файла, None) или (None, ошибка).
+    """
+    try:
+        with Image.open(upload) as image:
+            image.verify()
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        return None, _invalid_image(upload)
+    upload.seek(0)
+
+    field = instance._meta.get_field("image")
+    name = field.storage.save(field.generate_filename(instance, upload.name), upload)
+    if not build_variants(field.attr_class(instance, field, name), overwrite=True):
+        # verify() прошёл, но целиком изображение не декодируется
+        field.storage.delete(name)
+        return None, _invalid_image(upload)
+    return name, None
+
+
+def store_gallery_images(product: Product, uploads) -> list:
+    """
+    Проверяет и сохраняет файлы параллельно, возвращает имена для
+    ProductImages.image. Если хотя бы один файл не изображение, уже
+    сохранённые файлы удаляются и бросается ValidationError со всеми ошибками.
+    """
+    if not uploads:
+        return []
+    instance = ProductImages(product=product)
+    with ThreadPoolExecutor(max_workers=min(len(uploads), GALLERY_UPLOAD_WORKERS)) as pool:
+        results = list(pool.map(lambda upload: _store_image(instance, upload), uploads))
+
+    names = [name for name, _ in results if name]
+    errors = [error for _, error in results if error]
+    if errors:
+        field = instance._meta.get_field("image")
+        for name in names:
+            field_file = field.attr_class(instance, field, name)
+            delete_variants(field_file)
+            field.storage.delete(name)
+        raise ValidationError(errors)
+    return names
+
+
+def create_gallery(product: Product, names) -> list:
+    images = ProductImages.objects.bulk_create(
+        [ProductImages(product=product, image=name, image_variants_for=name) for name in names]
+    )
+    touch_change_stamp(ProductImages)  # bulk_create сигналов не шлёт
+    return images
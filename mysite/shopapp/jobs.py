@@ -0,0 +1,186 @@
+"""
+Фоновые задачи импорта и экспорта.
+
+Задачи хранятся в таблице Job, а выполняет их отдельный процесс
+`manage.py run_jobs`, поэтому большие файлы не держат воркер gunicorn.
+Загруженный исходный файл удаляется, как только задача завершилась.
+"""
+import logging
+from datetime import timedelta
+from tempfile import TemporaryFile
+
+from django.apps import apps
+from django.core.files import File
+from django.urls import reverse
+from django.utils import timezone
+
+from .common import (import_csv_products, import_csv_orders,
+                     iter_csv_rows, csv_export_columns, CSV_EXPORT_CHUNK_SIZE)
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# RUNNING без отчёта о прогрессе дольше этого - воркер, скорее всего, умер
+JOB_STALE_AFTER = timedelta(hours=1)
+
+
+def enqueue_job(kind, *, source=None, encoding="", params=None, user=None) -> Job:
+    job = Job(
+        kind=kind,
+        encoding=encoding or "",
+        params=params or {},
+        created_by=user if user and user.is_authenticated else None,
+    )
+    if source is not None:
+        job.source.save(source.name, source, save=False)
+    job.save()
+    return job
+
+
+def claim_next_job():
+    """
+    Забирает самую старую задачу в очереди. Смена статуса делается одним
+    UPDATE с условием на status, так что два воркера не возьмут одну задачу.
+    """
+    pending = (
+        Job.objects
+        .filter(status=Job.Status.PENDING)
+        .order_by("pk")
+        .values_list("pk", flat=True)[:10]
+    )
+    for pk in pending:
+        claimed = (
+            Job.objects
+            .filter(pk=pk, status=Job.Status.PENDING)
+            .update(status=Job.Status.RUNNING, started_at=timezone.now(), updated_at=timezone.now())
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def fail_stale_jobs(stale_after=JOB_STALE_AFTER) -> int:
+    """
+    Помечает FAILED задачи в RUNNING, которые не отчитывались о прогрессе
+    дольше stale_after, и удаляет их исходные файлы. Заново в очередь они
+    не ставятся: импорт мог успеть записать часть пачек, и повтор задвоил
+    бы строки.
+    """
+    now = timezone.now()
+    failed = 0
+    stale = Job.objects.filter(status=Job.Status.RUNNING, updated_at__lt=now - stale_after)
+    for job in stale.only("pk", "source", "errors"):
+        error = {"line": None, "error": "The worker stopped before the job finished"}
+        updated = (
+            Job.objects
+            .filter(pk=job.pk, status=Job.Status.RUNNING)
+            .update(status=Job.Status.FAILED, finished_at=now, updated_at=now,
+                    errors=job.errors + [error], source="")
+        )
+        if updated:
+            logger.warning("Job %s made no progress since %s, marked as failed", job.pk, now - stale_after)
+            if job.source:
+                job.source.storage.delete(job.source.name)
+            failed += 1
+    return failed
+
+
+def _report_progress(job: Job):
+    def progress(summary):
+        Job.objects.filter(pk=job.pk).update(
+            processed=summary.ok + summary.failed,
+            succeeded=summary.ok,
+            failed=summary.failed,
+            updated_at=timezone.now(),
+        )
+    return progress
+
+
+def _run_import(job: Job, importer):
+    with job.source.open("rb"):
+        summary = importer(
+            job.source.file,
+            encoding=job.encoding or None,
+            progress=_report_progress(job),
+        )
+    job.processed = summary.ok + summary.failed
+    job.succeeded = summary.ok
+    job.failed = summary.failed
+    job.errors = summary.errors
+
+
+def _run_export_csv(job: Job):
+    model = apps.get_model(job.params["model"])
+    field_names = csv_export_columns(model)
+    queryset = model.objects.order_by("pk")
+    if "pks" in job.params:
+        queryset = queryset.filter(pk__in=job.params["pks"])
+    rows = queryset.values_list(*field_names).iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE)
+
+    with TemporaryFile("w+b") as tmp:
+        for count, line in enumerate(iter_csv_rows(field_names, rows)):
+            tmp.write(line.encode())
+            if count and count % CSV_EXPORT_CHUNK_SIZE == 0:
+                Job.objects.filter(pk=job.pk).update(processed=count, succeeded=count, updated_at=timezone.now())
+        tmp.seek(0)
+        job.result.save(f"{model._meta.model_name}-export-{job.pk}.csv", File(tmp), save=False)
+    job.processed = job.succeeded = count
+
+
+JOB_HANDLERS = {
+    Job.Kind.IMPORT_PRODUCTS: lambda job: _run_import(job, import_csv_products),
+    Job.Kind.IMPORT_ORDERS: lambda job: _run_import(job, import_csv_orders),
+    Job.Kind.EXPORT_CSV: _run_export_csv,
+}
+
+
+JOB_RESULT_FIELDS = ("status", "processed", "succeeded", "failed", "errors", "result", "finished_at")
+
+
+def run_job(job: Job) -> Job:
+    try:
+        JOB_HANDLERS[job.kind](job)
+    except Exception as exc:
+        logger.exception("Job %s failed", job.pk)
+        job.status = Job.Status.FAILED
+        job.errors = job.errors + [{"line": None, "error": str(exc)}]
+    else:
+        job.status = Job.Status.DONE
+    job.finished_at = timezone.now()
+    # fail_stale_jobs мог уже завершить задачу: её статус не перезаписывается
+    finished = (
+        Job.objects
+        .filter(pk=job.pk, status=Job.Status.RUNNING)
+        .update(
+            **{name: getattr(job, name) for name in JOB_RESULT_FIELDS},
+            updated_at=job.finished_at,
+            source="",
+        )
+    )
+    if not finished:
+        logger.warning("Job %s was marked as failed while running, its result is dropped", job.pk)
+        if job.result:
+            job.result.delete(save=False)
+        job.refresh_from_db()
+        return job
+    if job.source:
+        # исходный файл нужен только для выполнения
+        job.source.delete(save=False)
+    return job
+
+
+def job_status(job: Job) -> dict:
+    return {
+        "pk": job.pk,
+        "kind": job.kind,
+        "status": job.status,
+        "processed": job.processed,
+        "succeeded": job.succeeded,
+        "failed": job.failed,
+        "errors": job.errors,
+        "result": job.result.url if job.result else None,
+        "status_url": reverse("shopapp:job_status", kwargs={"pk": job.pk}),
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand
+
+from mysite.images import IMAGE_FIELDS, build_variants, variants_field_name
+
+
+class Command(BaseCommand):
+
+    """
+    Builds thumbnail, medium and WebP variants of already uploaded images
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--overwrite",
+            action="store_true",
+            help="Rebuild variants that already exist",
+        )
+
+    def handle(self, *args, **options):
+        for model, field_name in IMAGE_FIELDS:
+            label = f"{model._meta.label}.{field_name}"
+            queryset = (
+                model.objects
+                .exclude(**{f"{field_name}__isnull": True})
+                .exclude(**{field_name: ""})
+                .order_by("pk")
+                .only("pk", field_name, variants_field_name(field_name))
+            )
+            built = 0
+            for instance in queryset.iterator(chunk_size=500):
+                if build_variants(getattr(instance, field_name), overwrite=options["overwrite"]):
+                    built += 1
+            self.stdout.write(f"{label}: built variants for {built} images")
+        self.stdout.write(self.style.SUCCESS("Image variants are up to date"))
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from mysite.sitemaps import write_sitemaps
+
+
+class Command(BaseCommand):
+
+    """
+    Pre-renders the sitemap index and section pages to gzip files
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default=settings.SITEMAP_BASE_URL,
+                            help="Scheme and host of the site, e.g. https://example.com")
+        parser.add_argument("--output", default=settings.SITEMAP_ROOT, help="Directory for the files")
+
+    def handle(self, *args, **options):
+        result = write_sitemaps(options["output"], options["base_url"].rstrip("/"))
+        for name in result["written"]:
+            self.stdout.write(f"Written {name}")
+        for name in result["removed"]:
+            self.stdout.write(f"Removed {name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Sitemaps are up to date: {len(result['written'])} written, "
+            f"{len(result['unchanged'])} unchanged, {len(result['removed'])} removed"
+        ))
@@ -0,0 +1,50 @@
+import time
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+
+from shopapp.jobs import JOB_STALE_AFTER, claim_next_job, fail_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+
+    """
+    Runs queued import/export jobs
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run all queued jobs and exit instead of polling forever",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds to sleep when the queue is empty",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=float,
+            default=JOB_STALE_AFTER.total_seconds(),
+            help="Fail jobs left running by a dead worker for longer than this many seconds",
+        )
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options["stale_after"])
+        self.stdout.write("Waiting for jobs")
+        while True:
+            job = claim_next_job()
+            if job is None:
+                failed = fail_stale_jobs(stale_after)
+                if failed:
+                    self.stdout.write(f"Failed {failed} jobs left running by a stopped worker")
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+                continue
+            self.stdout.write(f"Running {job}")
+            job = run_job(job)
+            self.stdout.write(f"Finished {job}: {job.succeeded} ok, {job.failed} failed")
+        self.stdout.write(self.style.SUCCESS("Queue is empty"))
@@ -0,0 +1,90 @@
+from django.db import migrations
+
+# SQL записан здесь, а не берётся из shopapp.search, чтобы изменения кода
+# приложения не меняли уже применённые миграции
+PRODUCT_FTS_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_ai",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_ad",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_au",
+    """
+    CREATE TRIGGER shopapp_product_fts_ai AFTER INSERT ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(rowid, name, descriptions)
+        VALUES (new.id, new.name, new.descriptions);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_ad AFTER DELETE ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, descriptions)
+        VALUES ('delete', old.id, old.name, old.descriptions);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_au AFTER UPDATE OF name, descriptions ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, descriptions)
+        VALUES ('delete', old.id, old.name, old.descriptions);
+        INSERT INTO shopapp_product_fts(rowid, name, descriptions)
+        VALUES (new.id, new.name, new.descriptions);
+    END
+    """,
+    "INSERT INTO shopapp_product_fts(shopapp_product_fts) VALUES ('rebuild')",
+]
+
+ORDER_FTS_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS shopapp_order_fts_ai",
+    "DROP TRIGGER IF EXISTS shopapp_order_fts_ad",
+    "DROP TRIGGER IF EXISTS shopapp_order_fts_au",
+    """
+    CREATE TRIGGER shopapp_order_fts_ai AFTER INSERT ON shopapp_order BEGIN
+        INSERT INTO shopapp_order_fts(rowid, delivery_address, user_id)
+        VALUES (new.id, new.delivery_address, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_order_fts_ad AFTER DELETE ON shopapp_order BEGIN
+        INSERT INTO shopapp_order_fts(shopapp_order_fts, rowid, delivery_address, user_id)
+        VALUES ('delete', old.id, old.delivery_address, old.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_order_fts_au AFTER UPDATE OF delivery_address, user_id ON shopapp_order BEGIN
+        INSERT INTO shopapp_order_fts(shopapp_order_fts, rowid, delivery_address, user_id)
+        VALUES ('delete', old.id, old.delivery_address, old.user_id);
+        INSERT INTO shopapp_order_fts(rowid, delivery_address, user_id)
+        VALUES (new.id, new.delivery_address, new.user_id);
+    END
+    """,
+    "INSERT INTO shopapp_order_fts(shopapp_order_fts) VALUES ('rebuild')",
+]
+
+FTS_TABLES = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS shopapp_product_fts"
+    " USING fts5(name, descriptions, content='shopapp_product', content_rowid='id')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS shopapp_order_fts"
+    " USING fts5(delivery_address, user_id, content='shopapp_order', content_rowid='id')",
+]
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    # FTS5 есть только в SQLite, на других СУБД поиск работает без индекса
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "sqlite":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "sqlite":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0011_job'),
+    ]
+
+    operations = [
+        SQLiteRunSQL(
+            FTS_TABLES + PRODUCT_FTS_TRIGGERS + ORDER_FTS_TRIGGERS,
+            ["DROP TABLE IF EXISTS shopapp_product_fts", "DROP TABLE IF EXISTS shopapp_order_fts"],
+        ),
+    ]
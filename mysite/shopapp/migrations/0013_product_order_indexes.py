@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:37
+
+from django.db import migrations, models
+
+# Копия SQL из 0012: миграция не зависит от текущего кода приложения
+PRODUCT_FTS_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_ai",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_ad",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_au",
+    """
+    CREATE TRIGGER shopapp_product_fts_ai AFTER INSERT ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(rowid, name, descriptions)
+        VALUES (new.id, new.name, new.descriptions);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_ad AFTER DELETE ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, descriptions)
+        VALUES ('delete', old.id, old.name, old.descriptions);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_au AFTER UPDATE OF name, descriptions ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, descriptions)
+        VALUES ('delete', old.id, old.name, old.descriptions);
+        INSERT INTO shopapp_product_fts(rowid, name, descriptions)
+        VALUES (new.id, new.name, new.descriptions);
+    END
+    """,
+    "INSERT INTO shopapp_product_fts(shopapp_product_fts) VALUES ('rebuild')",
+]
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    # FTS5 есть только в SQLite, на других СУБД поиск работает без индекса
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "sqlite":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "sqlite":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0012_product_order_fts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='descriptions',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['delivery_address'], name='shop_order_address_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('archived', False)), fields=['name', 'price'], name='shop_product_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at'], name='shop_product_created_idx'),
+        ),
+        # AlterField на SQLite пересоздаёт shopapp_product, и её FTS-триггеры удаляются
+        SQLiteRunSQL(PRODUCT_FTS_TRIGGERS, migrations.RunSQL.noop),
+    ]
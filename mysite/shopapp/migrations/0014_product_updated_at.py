@@ -0,0 +1,67 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:06
+
+from django.db import migrations, models
+from django.db.models import F
+
+# Копия SQL из 0012: миграция не зависит от текущего кода приложения
+PRODUCT_FTS_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_ai",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_ad",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_au",
+    """
+    CREATE TRIGGER shopapp_product_fts_ai AFTER INSERT ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(rowid, name, descriptions)
+        VALUES (new.id, new.name, new.descriptions);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_ad AFTER DELETE ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, descriptions)
+        VALUES ('delete', old.id, old.name, old.descriptions);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_au AFTER UPDATE OF name, descriptions ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, descriptions)
+        VALUES ('delete', old.id, old.name, old.descriptions);
+        INSERT INTO shopapp_product_fts(rowid, name, descriptions)
+        VALUES (new.id, new.name, new.descriptions);
+    END
+    """,
+    "INSERT INTO shopapp_product_fts(shopapp_product_fts) VALUES ('rebuild')",
+]
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    # FTS5 есть только в SQLite, на других СУБД поиск работает без индекса
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "sqlite":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "sqlite":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def fill_updated_at(apps, schema_editor):
+    # время миграции выдавало бы все старые товары за только что изменённые
+    apps.get_model("shopapp", "Product").objects.update(updated_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0013_product_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        # AddField с NOT NULL на SQLite пересоздаёт shopapp_product вместе с FTS-триггерами
+        SQLiteRunSQL(PRODUCT_FTS_TRIGGERS, migrations.RunSQL.noop),
+    ]
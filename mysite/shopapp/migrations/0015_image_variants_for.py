@@ -0,0 +1,79 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:26
+
+import posixpath
+
+from django.db import migrations, models
+
+# Копия SQL из 0012: миграция не зависит от текущего кода приложения
+PRODUCT_FTS_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_ai",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_ad",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_au",
+    """
+    CREATE TRIGGER shopapp_product_fts_ai AFTER INSERT ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(rowid, name, descriptions)
+        VALUES (new.id, new.name, new.descriptions);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_ad AFTER DELETE ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, descriptions)
+        VALUES ('delete', old.id, old.name, old.descriptions);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_au AFTER UPDATE OF name, descriptions ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, descriptions)
+        VALUES ('delete', old.id, old.name, old.descriptions);
+        INSERT INTO shopapp_product_fts(rowid, name, descriptions)
+        VALUES (new.id, new.name, new.descriptions);
+    END
+    """,
+    "INSERT INTO shopapp_product_fts(shopapp_product_fts) VALUES ('rebuild')",
+]
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    # FTS5 есть только в SQLite, на других СУБД поиск работает без индекса
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "sqlite":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "sqlite":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def record_variants(apps, schema_editor):
+    # варианты пишутся все сразу, достаточно проверить photo.thumb.jpg
+    for model_name, field_name in [("Product", "preview"), ("ProductImages", "image")]:
+        model = apps.get_model("shopapp", model_name)
+        storage = model._meta.get_field(field_name).storage
+        rows = model.objects.exclude(**{field_name: ""}).exclude(**{f"{field_name}__isnull": True})
+        for pk, name in rows.values_list("pk", field_name).iterator():
+            if storage.exists(posixpath.splitext(name)[0] + ".thumb.jpg"):
+                model.objects.filter(pk=pk).update(**{f"{field_name}_variants_for": name})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0014_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='preview_variants_for',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='productimages',
+            name='image_variants_for',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(record_variants, migrations.RunPython.noop),
+        # AddField на SQLite пересоздаёт shopapp_product вместе с FTS-триггерами
+        SQLiteRunSQL(PRODUCT_FTS_TRIGGERS, migrations.RunSQL.noop),
+    ]
@@ -17,14 +17,29 @@ class Product(models.Model):
     class Meta:
         ordering = ["name", "price"]
         verbose_name = _("Product")
+        indexes = [
+            # ProductsListView: archived=False ORDER BY name, price
+            models.Index(
+                fields=["name", "price"],
+                condition=models.Q(archived=False),
+                name="shop_product_active_idx",
+            ),
+            # LatestProductsFeed, ShopSitemap: ORDER BY created_at DESC
+            models.Index(fields=["-created_at"], name="shop_product_created_idx"),
+        ]
     name = models.CharField(max_length=100, db_index=True)
-    descriptions = models.TextField(null=False, blank=True, db_index=True)
+    # поиск по описанию идёт через FTS (shopapp.search), B-tree здесь не помогает
+    descriptions = models.TextField(null=False, blank=True)
     price = models.DecimalField(default=0, max_digits=8, decimal_places=2)
     discount = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # отметка для условных GET (mysite.changes); queryset.update() её не меняет
+    updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, default=1)
     archived = models.BooleanField(default=False)
     preview = models.ImageField(null=True, blank=True, upload_to=product_preview_directory_path)
+    # имя файла preview, для которого построены варианты (mysite.images)
+    preview_variants_for = models.CharField(max_length=100, blank=True, default="", editable=False)
 
     #@property
     #def description_short(self) -> str:
@@ -48,15 +63,61 @@ def products_images_directory_path(instance: "ProductImages", filename: str) ->
 class ProductImages(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products_images_directory_path', blank=True, null=True)
+    image_variants_for = models.CharField(max_length=100, blank=True, default="", editable=False)
     description = models.CharField(null=False, blank=True, max_length=200)
 
 
 class Order(models.Model):
     class Meta:
         verbose_name = _("Order")
+        indexes = [
+            # API: ?ordering=delivery_address. Фильтр по user покрывает индекс внешнего ключа
+            models.Index(fields=["delivery_address"], name="shop_order_address_idx"),
+        ]
     delivery_address = models.TextField(null=True, blank=True)
     promocode = models.CharField(max_length=20, null=False, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(User, on_delete=models.PROTECT)
     products = models.ManyToManyField(Product, related_name="orders")
     receipt = models.FileField(upload_to="orders/receipts", null=True)
+
+
+class Job(models.Model):
+    """
+    Фоновая задача импорта/экспорта, которую выполняет `manage.py run_jobs`.
+    """
+
+    class Kind(models.TextChoices):
+        IMPORT_PRODUCTS = "import_products", _("Import products")
+        IMPORT_ORDERS = "import_orders", _("Import orders")
+        EXPORT_CSV = "export_csv", _("Export as CSV")
+
+    class Status(models.TextChoices):
+        PENDING = "pending", _("Pending")
+        RUNNING = "running", _("Running")
+        DONE = "done", _("Done")
+        FAILED = "failed", _("Failed")
+
+    class Meta:
+        ordering = ["-pk"]
+        verbose_name = _("Job")
+
+    kind = models.CharField(max_length=32, choices=Kind.choices)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING, db_index=True)
+    params = models.JSONField(default=dict, blank=True)
+    source = models.FileField(upload_to="jobs/sources", null=True, blank=True)
+    encoding = models.CharField(max_length=40, blank=True)
+    result = models.FileField(upload_to="jobs/results", null=True, blank=True)
+    processed = models.PositiveIntegerField(default=0)
+    succeeded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # отметка жизни воркера: обновляется при каждом отчёте о прогрессе
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"Job(pk={self.pk}, kind={self.kind!r}, status={self.status!r})"
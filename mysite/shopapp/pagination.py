@@ -0,0 +1,163 @@
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
+from rest_framework.response import Response
+
+
+def estimate_count(queryset: QuerySet):
+    """
+    Оценка числа строк таблицы из статистики планировщика (reltuples в
+    PostgreSQL, sqlite_stat1 после ANALYZE в SQLite). К отфильтрованному
+    queryset она не относится, поэтому для него и без статистики - None.
+    """
+    if queryset.query.where:
+        return None
+
+    table = queryset.model._meta.db_table
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            # -1 - таблицу ещё ни разу не анализировали
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == "sqlite":
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # первое число stat - строк в таблице, для любого её индекса
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+    return None
+
+
+def _beyond(name, value, descending, nulls_largest) -> Q:
+    """
+    Строки, которые в сортировке по name идут строго после value; NULL
+    стоит в конце возрастающей сортировки, если nulls_largest, иначе в начале.
+    """
+    nulls_after = nulls_largest != descending
+    if value is None:
+        return Q(**{f"{name}__isnull": False}) if not nulls_after else Q(pk__in=[])
+    beyond = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+    return beyond | Q(**{f"{name}__isnull": True}) if nulls_after else beyond
+
+
+class ShopCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация без COUNT(*) и OFFSET: страница N стоит столько же,
+    сколько первая. Сортировку задаёт OrderingFilter (?ordering=price),
+    по умолчанию - pk; pk всегда добавляется последним полем, и позиция
+    курсора хранит значения всех полей сортировки, так что она уникальна
+    и смещение внутри курсора не нужно даже на длинных сериях одинаковых
+    цен или имён. ?count=estimate добавляет в ответ оценку count, если
+    список не отфильтрован и у БД есть статистика.
+    """
+    ordering = "pk"
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    count_query_param = "count"
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        pk_names = {"pk", queryset.model._meta.pk.name}
+        if not any(field.lstrip("-") in pk_names for field in ordering):
+            ordering += ("pk",)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) == "estimate":
+            self.count = estimate_count(queryset)
+
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        current_position = None if self.cursor is None else self.cursor.position
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if current_position is not None:
+            queryset = queryset.filter(self.after_position(current_position, reverse, queryset.db))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > len(self.page)
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, current_position is not None
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def after_position(self, position, reverse, using) -> Q:
+        """
+        Строки строго после position в порядке self.ordering (до неё при
+        reverse): (a > x) OR (a = x AND b > y) OR ...
+        """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        nulls_largest = connections[using].features.nulls_order_largest
+        condition, equal = Q(), Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            descending = field.startswith("-") != reverse
+            condition |= equal & _beyond(name, value, descending, nulls_largest)
+            equal &= Q(**{f"{name}__isnull": True} if value is None else {name: value})
+        return condition
+
+    # позиции уникальны, поэтому offset курсора всегда 0
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        # пустая страница при движении назад: дальше - с самого начала
+        position = self._get_position_from_instance(self.page[-1], self.ordering) if self.page else None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip("-")
+            values.append(instance[name] if isinstance(instance, dict) else getattr(instance, name))
+        # str() без потерь для Decimal и datetime, в отличие от DjangoJSONEncoder
+        return json.dumps(values, default=str)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response["count"] = self.count
+        response["next"] = self.get_next_link()
+        response["previous"] = self.get_previous_link()
+        response["results"] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"] = {
+            "count": {"type": "integer", "example": 123},
+            **response_schema["properties"],
+        }
+        return response_schema
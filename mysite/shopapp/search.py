@@ -0,0 +1,98 @@
+"""
+Полнотекстовый поиск по товарам и заказам на SQLite FTS5.
+
+Для таблицы модели есть FTS5-таблица с внешним содержимым (content=...),
+а триггеры держат её в актуальном состоянии при любых изменениях:
+save/delete, bulk_create из импорта CSV и queryset.update(). Таблицы и
+триггеры создаёт миграция 0012 со своей копией SQL. SQLite теряет
+триггеры, когда миграция пересоздаёт таблицу (AddField, AlterField),
+поэтому такая миграция создаёт их заново (см. 0013-0015).
+На других СУБД поиск откатывается к обычному SearchFilter.
+"""
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter, OrderingFilter
+
+FTS_INDEXES = {
+    "shopapp_product": ("name", "descriptions"),
+    "shopapp_order": ("delivery_address", "user_id"),
+}
+SEARCH_RANK = "search_rank"
+
+
+def fts_table(table: str) -> str:
+    return f"{table}_fts"
+
+
+_fts_ready = {}
+
+
+def fts_ready(alias: str) -> bool:
+    if alias not in _fts_ready:
+        connection = connections[alias]
+        ready = False
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN (%s, %s)",
+                    [fts_table(table) for table in FTS_INDEXES],
+                )
+                ready = cursor.fetchone()[0] == len(FTS_INDEXES)
+        _fts_ready[alias] = ready
+    return _fts_ready[alias]
+
+
+def build_match_query(terms) -> str:
+    # каждое слово в кавычках (чтобы не сработал синтаксис FTS5) и по префиксу
+    return " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    SearchFilter, который ищет через FTS5 и добавляет к строкам
+    аннотацию search_rank (bm25, чем меньше - тем релевантнее).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        table = queryset.model._meta.db_table
+        if not terms or table not in FTS_INDEXES or not fts_ready(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+
+        fts = fts_table(table)
+        match = build_match_query(terms)
+        return (
+            queryset
+            .filter(pk__in=RawSQL(f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s", [match]))
+            .annotate(**{SEARCH_RANK: RawSQL(
+                f'SELECT rank FROM {fts} WHERE {fts} MATCH %s AND rowid = "{table}"."id"',
+                [match],
+                output_field=FloatField(),
+            )})
+        )
+
+
+class RankOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter, который при поиске по умолчанию сортирует по
+    релевантности и разрешает ?ordering=search_rank только вместе с ?search=.
+    """
+
+    def is_ranked(self, request, queryset) -> bool:
+        return (
+            bool(SearchFilter().get_search_terms(request)) and
+            queryset.model._meta.db_table in FTS_INDEXES and
+            fts_ready(queryset.db)
+        )
+
+    def get_default_ordering(self, view):
+        if self.is_ranked(view.request, view.get_queryset()):
+            return [SEARCH_RANK]
+        return super().get_default_ordering(view)
+
+    def get_valid_fields(self, queryset, view, context={}):
+        valid_fields = super().get_valid_fields(queryset, view, context)
+        if self.is_ranked(view.request, queryset):
+            valid_fields.append((SEARCH_RANK, SEARCH_RANK))
+        return valid_fields
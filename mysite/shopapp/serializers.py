@@ -1,10 +1,13 @@
 from rest_framework import serializers
 
+from mysite.images import ImageVariantsField
 from .models import Product
 from .models import Order
 
 
 class ProductSerializer(serializers.ModelSerializer):
+    preview_variants = ImageVariantsField(source="preview")
+
     class Meta:
         model = Product
         fields = (
@@ -14,8 +17,10 @@ class ProductSerializer(serializers.ModelSerializer):
             "price",
             "discount",
             "created_at",
+            "updated_at",
             "archived",
             "preview",
+            "preview_variants",
         )
 
 
@@ -0,0 +1,39 @@
+from django.db.models.signals import post_init, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .cache import bump_user_orders_version
+from .models import Order
+
+
+@receiver(post_init, sender=Order)
+def remember_order_user(sender, instance: Order, **kwargs):
+    # __dict__, а не instance.user_id: поле может быть отложено через only()
+    instance._loaded_user_id = instance.__dict__.get("user_id")
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance: Order, **kwargs):
+    bump_user_orders_version(instance.user_id, instance._loaded_user_id)
+    instance._loaded_user_id = instance.user_id
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance: Order, **kwargs):
+    bump_user_orders_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def order_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            bump_user_orders_version(instance.user_id)
+        return
+
+    # product.orders.add(...)/remove(...)/clear(): instance - товар
+    if action in ("post_add", "post_remove"):
+        orders = Order.objects.filter(pk__in=pk_set)
+    elif action == "pre_clear":
+        orders = instance.orders.all()
+    else:
+        return
+    bump_user_orders_version(*orders.values_list("user_id", flat=True))
@@ -1,4 +1,8 @@
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.db.models import Max
+from django.urls import reverse
+from django.utils import translation
 
 from .models import Product
 
@@ -6,8 +10,23 @@ from .models import Product
 class ShopSitemap(Sitemap):
     changefreq = "never"
     priority = 0.9
+
     def items(self):
-        return Product.objects.filter(created_at__isnull=False).order_by('-created_at')
+        # только pk и дата: экземпляры моделей для адреса не нужны
+        return (
+            Product.objects
+            .filter(created_at__isnull=False)
+            .order_by('-created_at')
+            .values_list("pk", "updated_at")
+        )
+
+    def location(self, item) -> str:
+        # /sitemap.xml вне i18n_patterns, язык берём основной, а не из запроса
+        with translation.override(settings.LANGUAGES[0][0]):
+            return reverse('shopapp:products_details', kwargs={'pk': item[0]})
+
+    def lastmod(self, item):
+        return item[1]
 
-    def lastmod(self, obj:Product):
-        return obj.created_at
+    def get_latest_lastmod(self):
+        return Product.objects.aggregate(latest=Max("updated_at"))["latest"]
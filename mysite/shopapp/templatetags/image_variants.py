@@ -0,0 +1,38 @@
+from django import template
+from django.utils.html import format_html
+
+from mysite.images import IMAGE_VARIANTS, srcset, variant_urls
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(field_file, variant="thumb", alt="", sizes=None):
+    """
+    <picture> с WebP и JPEG-вариантами изображения. Пока вариантов нет
+    (не запускали build_image_variants) - обычный <img> с оригиналом.
+
+        {% picture product.preview "thumb" alt=product.name %}
+    """
+    if not field_file:
+        return ""
+    urls = variant_urls(field_file)
+    if not urls:
+        return format_html('<img src="{}" alt="{}" loading="lazy">', field_file.url, alt)
+    sizes = sizes or f"{IMAGE_VARIANTS[variant]}px"
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy"></picture>',
+        srcset(urls, "webp"), sizes,
+        urls[variant]["jpg"], srcset(urls, "jpg"), sizes, alt,
+    )
+
+
+@register.filter
+def image_variant(field_file, variant="thumb"):
+    """
+    URL JPEG-варианта или оригинала, если вариантов нет: {{ img|image_variant:"medium" }}
+    """
+    if not field_file:
+        return ""
+    return variant_urls(field_file).get(variant, {}).get("jpg", field_file.url)
@@ -1,15 +1,62 @@
 import json
+import unittest
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User, Group, Permission
-from django.test import TestCase
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
 
-from shopapp.models import Product, Order
+from shopapp.cache import get_user_orders_version
+from shopapp.common import import_csv_products, import_csv_orders, convert_str_to_int_list
+from shopapp.jobs import claim_next_job, enqueue_job, fail_stale_jobs, run_job
+from shopapp.models import Product, ProductImages, Order, Job
+from shopapp.serializers import ProductSerializer, OrderSerializer
+from mysite.images import IMAGE_VARIANTS, variant_name
+from mysite.values import values_reader
+from requestdataapp.queries import QueryBudgetTestMixin, QueryCountTestMixin
+from shopapp.sitemap import ShopSitemap
+from shopapp.views import ProductsListView, LatestProductsFeed
 from django.utils.translation import activate
 
 activate('en')
 
 
+class TempMediaRootMixin:
+    """
+    Временный MEDIA_ROOT на каждый тест и картинки для загрузки в ImageField.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def make_image(self, name="preview.png", size=(1600, 1200)):
+        # .jpg - JPEG, иначе PNG с прозрачностью
+        buffer = BytesIO()
+        if name.endswith(".jpg"):
+            Image.new("RGB", size, (20, 120, 200)).save(buffer, "JPEG")
+            return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+        Image.new("RGBA", size, (200, 30, 30, 128)).save(buffer, "PNG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
 class ProductCreateViewTestCase(TestCase):
 
     @classmethod
@@ -153,11 +200,34 @@ class ProductsExportViewTestCase(TestCase):
             }
             for product in products
         ]
-        products_data = response.json()
+        products_data = json.loads(b"".join(response.streaming_content))
         self.assertEqual(
             products_data["products"],
             expected_data
         )
+        self.assertEqual(products_data["last_pk"], products.last().pk)
+
+    def test_get_products_view_since_pk(self):
+        first = Product.objects.order_by('pk').first()
+        response = self.client.get(
+            reverse("shopapp:products_export"),
+            {"since_pk": first.pk},
+            HTTP_USER_AGENT="Mozilla/5.0",
+        )
+        products_data = json.loads(b"".join(response.streaming_content))
+        self.assertNotIn(first.pk, [product["pk"] for product in products_data["products"]])
+        self.assertEqual(
+            len(products_data["products"]),
+            Product.objects.filter(pk__gt=first.pk).count(),
+        )
+
+    def test_get_products_view_empty_catalog(self):
+        Product.objects.all().delete()
+        response = self.client.get(reverse("shopapp:products_export"), HTTP_USER_AGENT="Mozilla/5.0")
+        self.assertEqual(
+            json.loads(b"".join(response.streaming_content)),
+            {"products": [], "last_pk": None},
+        )
 
 
 class OrderExportViewTestCase(TestCase):
@@ -192,7 +262,10 @@ class OrderExportViewTestCase(TestCase):
                 "delivery_address": order.delivery_address,
                 "promocode": order.promocode,
                 "user_id": order.user_id,
-                "products": str(order.products.values_list("name"))
+                "products": [
+                    {"pk": product.pk, "name": product.name}
+                    for product in order.products.order_by("pk")
+                ]
 
             }
             for order in orders
@@ -202,3 +275,794 @@ class OrderExportViewTestCase(TestCase):
             products_data["orders"],
             expected_data
         )
+
+
+class OrderExportNDJSONTestCase(TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'products-fixture.json',
+        'groups-fixture.json',
+        'orders-fixture.json',
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test-ndjson', password='111', is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_get_orders_view_ndjson(self):
+        response = self.client.get(
+            reverse("shopapp:orders_export"),
+            {"format": "ndjson"},
+            HTTP_USER_AGENT="Mozilla/5.0",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        orders = [json.loads(line) for line in lines]
+        self.assertEqual([order["pk"] for order in orders], [1, 2])
+        self.assertEqual(orders[0]["products"], [{"pk": 1, "name": "112"}, {"pk": 2, "name": "sddf"}])
+
+
+class AsyncExportViewsTestCase(TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'products-fixture.json',
+        'groups-fixture.json',
+        'orders-fixture.json',
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test-async', password='111', is_staff=True)
+        self.async_client.force_login(self.user)
+
+    async def get(self, url, data=None):
+        return await self.async_client.get(url, data, headers={"user-agent": "Mozilla/5.0"})
+
+    async def read(self, response) -> bytes:
+        return b"".join([chunk async for chunk in response.streaming_content])
+
+    async def test_products_export_streams_async(self):
+        response = await self.get(reverse("shopapp:products_export"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        data = json.loads(await self.read(response))
+        pks = [pk async for pk in Product.objects.order_by("pk").values_list("pk", flat=True)]
+        self.assertEqual([product["pk"] for product in data["products"]], pks)
+        self.assertEqual(data["last_pk"], pks[-1])
+
+    async def test_products_export_rejects_bad_since_pk(self):
+        response = await self.get(reverse("shopapp:products_export"), {"since_pk": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_orders_export_ndjson_streams_async(self):
+        response = await self.get(reverse("shopapp:orders_export"), {"format": "ndjson"})
+        self.assertTrue(response.is_async)
+        orders = [json.loads(line) for line in (await self.read(response)).decode().splitlines()]
+        self.assertEqual([order["pk"] for order in orders], [1, 2])
+        self.assertEqual(orders[0]["products"], [{"pk": 1, "name": "112"}, {"pk": 2, "name": "sddf"}])
+
+    async def test_orders_export_requires_staff(self):
+        self.user.is_staff = False
+        await self.user.asave()
+        response = await self.get(reverse("shopapp:orders_export"))
+        self.assertEqual(response.status_code, 403)
+
+        await sync_to_async(self.async_client.logout)()
+        response = await self.get(reverse("shopapp:orders_export"))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_user_orders_export(self):
+        url = reverse("shopapp:user_order_explorer", kwargs={"pk": self.user.pk})
+        await Order.objects.acreate(user=self.user, delivery_address="async")
+        response = await self.get(url)
+        self.assertEqual(
+            [order["delivery_address"] for order in response.json()[str(self.user)]],
+            ["async"],
+        )
+        response = await self.get(reverse("shopapp:user_order_explorer", kwargs={"pk": 10 ** 6}))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_latest_products_feed(self):
+        response = await self.get(reverse("shopapp:latest_products_feed"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"<rss", response.content)
+
+
+class ConditionalGetTestCase(TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'products-fixture.json',
+        'groups-fixture.json',
+    ]
+
+    def get(self, url, **extra):
+        return self.client.get(url, HTTP_USER_AGENT="Mozilla/5.0", **extra)
+
+    def assertNotModified(self, url, response):
+        with self.assertTemplateNotUsed("shopapp/products-details.html"):
+            again = self.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        again = self.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(again.status_code, 304)
+
+    def test_product_details(self):
+        url = reverse("shopapp:products_details", kwargs={"pk": 1})
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotModified(url, response)
+
+        Product.objects.get(pk=1).save()
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+    def test_product_details_track_gallery_and_creator(self):
+        url = reverse("shopapp:products_details", kwargs={"pk": 1})
+        etag = self.get(url)["ETag"]
+        image = ProductImages.objects.create(product_id=1, image="gallery.jpg", image_variants_for="gallery.jpg")
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.get(url)["ETag"]
+        image.delete()
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.get(url)["ETag"]
+        Product.objects.get(pk=1).created_by.save()
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_api_retrieve(self):
+        url = reverse("shopapp:product-detail", kwargs={"pk": 1})
+        response = self.get(url, HTTP_ACCEPT="application/json")
+        self.assertIn("updated_at", response.json())
+        self.assertNotModified(url, response)
+        self.assertEqual(self.get(reverse("shopapp:product-detail", kwargs={"pk": "x"})).status_code, 404)
+
+    def test_latest_products_feed(self):
+        url = reverse("shopapp:latest_products_feed")
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            again = self.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+        Product.objects.create(name="feed", created_by_id=1)
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+    def test_admin_archive_action_changes_stamps(self):
+        admin = User.objects.create_superuser(username="conditional-admin", password="111")
+        self.client.force_login(admin)
+        details = reverse("shopapp:products_details", kwargs={"pk": 1})
+        feed = reverse("shopapp:latest_products_feed")
+        etags = {url: self.get(url)["ETag"] for url in (details, feed)}
+
+        self.client.post(
+            reverse("admin:shopapp_product_changelist"),
+            {"action": "mark_archived", "_selected_action": [1]},
+            HTTP_USER_AGENT="Mozilla/5.0",
+        )
+        for url, etag in etags.items():
+            self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ProductsDownloadCSVTestCase(TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'products-fixture.json',
+        'groups-fixture.json',
+    ]
+
+    def test_download_csv_streams_filtered_rows(self):
+        response = self.client.get(
+            reverse("shopapp:product-download-csv"),
+            {"name": "112"},
+            HTTP_USER_AGENT="Mozilla/5.0",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(
+            content.splitlines(),
+            ["name,descriptions,price,discount", "112,we,11.00,11"],
+        )
+
+
+class ProductAdminExportCSVTestCase(TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'products-fixture.json',
+        'groups-fixture.json',
+    ]
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="admin-export", password="111")
+        self.client.force_login(self.admin)
+
+    def test_export_csv_uses_raw_foreign_key_ids(self):
+        products = Product.objects.order_by("pk")
+        response = self.client.post(
+            reverse("admin:shopapp_product_changelist"),
+            {
+                "action": "export_csv",
+                "_selected_action": [product.pk for product in products],
+            },
+            HTTP_USER_AGENT="Mozilla/5.0",
+        )
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:2], ["id", "name"])
+        self.assertIn("created_by_id", lines[0].split(","))
+        self.assertEqual(len(lines), products.count() + 1)
+
+
+class ImportCSVProductsTestCase(TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'groups-fixture.json',
+    ]
+
+    def test_import_in_batches_and_report_failed_rows(self):
+        csv_file = BytesIO(
+            b"name,descriptions,price,discount\n"
+            b"first,desc,10.50,1\n"
+            b"second,desc,abc,0\n"
+            b"third,,3,0\n"
+        )
+        summary = import_csv_products(csv_file, encoding="utf-8", batch_size=2)
+
+        self.assertEqual(summary.ok, 2)
+        self.assertEqual(summary.failed, 1)
+        self.assertEqual(summary.errors[0]["line"], 3)
+        self.assertEqual(
+            list(Product.objects.order_by("name").values_list("name", flat=True)),
+            ["first", "third"],
+        )
+
+
+class ImportCSVOrdersTestCase(TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'products-fixture.json',
+        'groups-fixture.json',
+    ]
+
+    def test_convert_str_to_int_list_keeps_multi_digit_ids(self):
+        self.assertEqual(convert_str_to_int_list("[12,5]"), [12, 5])
+        self.assertEqual(convert_str_to_int_list("[]"), [])
+
+    def test_import_orders_with_bulk_through_rows(self):
+        csv_file = BytesIO(
+            b"delivery_address,promocode,user_id,product\n"
+            b'"street 1",promo,1,"[1,2]"\n'
+            b'"street 2",,1,"[2]"\n'
+            b'"street 3",,1,"[999]"\n'
+        )
+        # две пачки по две проверки (пользователи, товары); для первой пачки
+        # ещё SAVEPOINT/RELEASE и по одному INSERT заказов и связей
+        with self.assertNumQueries(2 + 2 + 2 + 2):
+            summary = import_csv_orders(csv_file, encoding="utf-8", batch_size=2)
+
+        self.assertEqual(summary.ok, 2)
+        self.assertEqual(summary.failed, 1)
+        order = Order.objects.get(delivery_address="street 1")
+        self.assertEqual(sorted(order.products.values_list("pk", flat=True)), [1, 2])
+
+
+class ProductImportJobTestCase(TempMediaRootMixin, TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'groups-fixture.json',
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user(username="staff-jobs", password="111", is_staff=True)
+
+    def test_upload_csv_is_queued_and_processed_by_worker(self):
+        upload = SimpleUploadedFile(
+            "products.csv",
+            b"name,descriptions,price,discount\nqueued,desc,5,0\n",
+            content_type="text/csv",
+        )
+        response = self.client.post(
+            reverse("shopapp:product-upload-csv"),
+            {"file": upload},
+            HTTP_USER_AGENT="Mozilla/5.0",
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], Job.Status.PENDING)
+        self.assertFalse(Product.objects.filter(name="queued").exists())
+
+        job = run_job(claim_next_job())
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertTrue(Product.objects.filter(name="queued").exists())
+        self.assertIsNone(claim_next_job())
+
+        self.client.force_login(self.staff)
+        response = self.client.get(
+            reverse("shopapp:job_status", kwargs={"pk": job.pk}),
+            HTTP_USER_AGENT="Mozilla/5.0",
+        )
+        self.assertEqual(response.json()["succeeded"], 1)
+
+    def test_export_csv_job_writes_result_file(self):
+        Product.objects.create(name="exported")
+        job = Job.objects.create(kind=Job.Kind.EXPORT_CSV, params={"model": "shopapp.product"})
+
+        job = run_job(claim_next_job())
+
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertEqual(job.processed, 1)
+        with job.result.open("rb") as result:
+            self.assertIn(b"exported", result.read())
+
+    def test_source_is_deleted_when_job_finishes(self):
+        job = enqueue_job(Job.Kind.IMPORT_PRODUCTS, source=SimpleUploadedFile("bad.csv", b"not,a\ncsv"))
+        path = Path(job.source.path)
+
+        job = run_job(claim_next_job())
+
+        self.assertIn(job.status, (Job.Status.DONE, Job.Status.FAILED))
+        self.assertFalse(path.exists())
+        self.assertFalse(Job.objects.get(pk=job.pk).source)
+
+    def test_jobs_of_dead_workers_are_failed(self):
+        job = enqueue_job(Job.Kind.IMPORT_PRODUCTS, source=SimpleUploadedFile("stuck.csv", b"name\n"))
+        path = Path(job.source.path)
+        claim_next_job()
+        self.assertEqual(fail_stale_jobs(), 0)
+
+        Job.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=2))
+        call_command("run_jobs", "--once", stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertIsNotNone(job.finished_at)
+        self.assertFalse(path.exists())
+
+    def test_long_job_with_progress_is_not_stale(self):
+        job = enqueue_job(Job.Kind.IMPORT_PRODUCTS, source=SimpleUploadedFile("long.csv", b"name\n"))
+        claim_next_job()
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=2))
+
+        self.assertEqual(fail_stale_jobs(), 0)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.Status.RUNNING)
+
+    def test_failed_stale_job_is_not_resurrected(self):
+        Product.objects.create(name="exported")
+        Job.objects.create(kind=Job.Kind.EXPORT_CSV, params={"model": "shopapp.product"})
+        job = claim_next_job()
+        Job.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=2))
+        fail_stale_jobs()
+
+        job = run_job(job)
+
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.Status.FAILED)
+        self.assertFalse(job.result)
+
+    def test_background_export_of_all_filtered_rows(self):
+        for name in ("match one", "match two", "other"):
+            Product.objects.create(name=name)
+        self.client.force_login(User.objects.create_superuser(username="admin-jobs", password="111"))
+
+        response = self.client.post(
+            reverse("admin:shopapp_product_changelist") + "?q=match",
+            {
+                "action": "export_csv_background",
+                "select_across": "1",
+                "index": "0",
+                "_selected_action": [Product.objects.get(name="match one").pk],
+            },
+            HTTP_USER_AGENT="Mozilla/5.0",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        job = run_job(claim_next_job())
+        with job.result.open("rb") as result:
+            exported = result.read()
+        self.assertEqual(job.processed, 2)
+        self.assertIn(b"match two", exported)
+        self.assertNotIn(b"other", exported)
+
+
+class ProductCursorPaginationTestCase(TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'products-fixture.json',
+        'groups-fixture.json',
+    ]
+
+    def test_list_walks_pages_without_count_query(self):
+        url = reverse("shopapp:product-list") + "?page_size=1&ordering=-price,name"
+        names = []
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                data = self.client.get(url, HTTP_USER_AGENT="Mozilla/5.0").json()
+                names.extend(product["name"] for product in data["results"])
+                url = data["next"]
+
+        self.assertEqual(sorted(names), sorted(Product.objects.values_list("name", flat=True)))
+        self.assertFalse(any("COUNT(" in query["sql"] for query in queries.captured_queries))
+        self.assertNotIn("count", data)
+
+    def pages(self, url, link="next", key="name"):
+        pages = []
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                data = self.client.get(url, HTTP_USER_AGENT="Mozilla/5.0").json()
+                pages.append([row[key] for row in data["results"]])
+                url = data[link]
+        self.assertFalse(any("OFFSET" in query["sql"] for query in queries.captured_queries))
+        return pages, data
+
+    def test_equal_values_are_paged_by_pk_without_offset(self):
+        Product.objects.bulk_create([Product(name=f"same {i:02}", price=7) for i in range(12)])
+        expected = list(Product.objects.order_by("-price", "pk").values_list("name", flat=True))
+
+        pages, last = self.pages(reverse("shopapp:product-list") + "?page_size=5&ordering=-price")
+        self.assertEqual(sum(pages, []), expected)
+
+        previous_pages, _ = self.pages(last["previous"], link="previous")
+        self.assertEqual(sum(reversed(previous_pages), []) + pages[-1], expected)
+
+    def test_nullable_ordering_field(self):
+        user = User.objects.first()
+        Order.objects.bulk_create([
+            Order(user=user, delivery_address=None if i % 3 else f"street {i % 2}") for i in range(9)
+        ])
+        self.client.force_login(User.objects.create_superuser(username="pager", password="111"))
+        expected = sorted(Order.objects.values_list("pk", flat=True))
+
+        pages, last = self.pages(
+            reverse("shopapp:order-list") + "?page_size=2&ordering=-delivery_address", key="pk",
+        )
+        self.assertEqual(sorted(sum(pages, [])), expected)
+        previous_pages, _ = self.pages(last["previous"], link="previous", key="pk")
+        self.assertEqual(sum(reversed(previous_pages), []) + pages[-1], sum(pages, []))
+
+    def test_estimated_count_is_opt_in(self):
+        url = reverse("shopapp:product-list")
+        self.assertNotIn("count", self.client.get(url, {"count": "estimate"}, HTTP_USER_AGENT="Mozilla/5.0").json())
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        response = self.client.get(url, {"count": "estimate"}, HTTP_USER_AGENT="Mozilla/5.0")
+        self.assertEqual(response.json()["count"], Product.objects.count())
+
+        response = self.client.get(url, {"count": "estimate", "archived": "false"}, HTTP_USER_AGENT="Mozilla/5.0")
+        self.assertNotIn("count", response.json())
+
+
+class ProductFullTextSearchTestCase(TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'groups-fixture.json',
+    ]
+
+    def search(self, query, **params):
+        response = self.client.get(
+            reverse("shopapp:product-list"),
+            {"search": query, **params},
+            HTTP_USER_AGENT="Mozilla/5.0",
+        )
+        self.assertEqual(response.status_code, 200)
+        return [product["name"] for product in response.json()["results"]]
+
+    def test_search_is_ranked_and_follows_changes(self):
+        Product.objects.bulk_create([
+            Product(name="Gaming laptop", descriptions="laptop with a laptop bag"),
+            Product(name="Desktop", descriptions="comes without a laptop"),
+            Product(name="Smartphone", descriptions="phone"),
+        ])
+        self.assertEqual(self.search("laptop"), ["Gaming laptop", "Desktop"])
+        self.assertEqual(self.search("lapt", ordering="name"), ["Desktop", "Gaming laptop"])
+
+        Product.objects.filter(name="Smartphone").update(descriptions="pocket laptop")
+        Product.objects.filter(name="Desktop").delete()
+        self.assertEqual(sorted(self.search("laptop")), ["Gaming laptop", "Smartphone"])
+
+    def test_search_terms_are_not_parsed_as_fts_syntax(self):
+        Product.objects.create(name="Quoted", descriptions='say "hi" OR bye')
+        self.assertEqual(self.search('"hi" OR'), ["Quoted"])
+
+
+class ValuesListTestCase(TempMediaRootMixin, TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'products-fixture.json',
+        'groups-fixture.json',
+        'orders-fixture.json',
+    ]
+
+    def assertListMatchesSerializer(self, url_name, serializer_class, queryset):
+        response = self.client.get(reverse(url_name), HTTP_USER_AGENT="Mozilla/5.0")
+        self.assertEqual(response.status_code, 200)
+        expected = serializer_class(queryset, many=True, context={"request": response.wsgi_request}).data
+        self.assertEqual(response.json()["results"], json.loads(json.dumps(expected, default=str)))
+
+    def test_products_match_serializer(self):
+        Product.objects.create(name="with preview", price="10.5", preview=self.make_image(size=(40, 30)))
+        self.assertIsNotNone(values_reader(ProductSerializer))
+        self.assertListMatchesSerializer("shopapp:product-list", ProductSerializer, Product.objects.order_by("pk"))
+
+    def test_orders_match_serializer(self):
+        self.assertListMatchesSerializer("shopapp:order-list", OrderSerializer, Order.objects.order_by("pk"))
+
+    def test_pages_ordered_by_search_rank(self):
+        Product.objects.bulk_create([
+            Product(name="Gaming laptop", descriptions="laptop with a laptop bag"),
+            Product(name="Desktop", descriptions="comes without a laptop"),
+        ])
+        url = reverse("shopapp:product-list") + "?search=laptop&page_size=1"
+        names = []
+        while url:
+            data = self.client.get(url, HTTP_USER_AGENT="Mozilla/5.0").json()
+            self.assertNotIn("search_rank", data["results"][0])
+            names.extend(product["name"] for product in data["results"])
+            url = data["next"]
+        self.assertEqual(names, ["Gaming laptop", "Desktop"])
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite specific")
+class QueryPlanTestCase(TestCase):
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        self.assertNotIn("USE TEMP B-TREE", plan)
+        for line in plan.splitlines():
+            if "SCAN" in line:
+                self.assertIn("USING", line, f"full table scan in plan:\n{plan}")
+
+    def test_hot_queries_use_indexes(self):
+        user = User.objects.create_user(username="plan")
+        self.assertUsesIndex(ProductsListView.queryset)
+        self.assertUsesIndex(LatestProductsFeed().items())
+        self.assertUsesIndex(ShopSitemap().items())
+        self.assertUsesIndex(Order.objects.filter(user=user))
+        self.assertUsesIndex(Order.objects.order_by("delivery_address"))
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "ratelimit": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+})
+class UserOrderExportCacheTestCase(TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'products-fixture.json',
+        'groups-fixture.json',
+    ]
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="cache-owner", password="111")
+        self.client.force_login(self.owner)
+        self.url = reverse("shopapp:user_order_explorer", kwargs={"pk": self.owner.pk})
+
+    def export(self):
+        response = self.client.get(self.url, HTTP_USER_AGENT="Mozilla/5.0")
+        return response.json()[str(self.owner)]
+
+    def test_cached_export_follows_order_changes(self):
+        order = Order.objects.create(user=self.owner, delivery_address="first")
+        self.assertEqual([o["delivery_address"] for o in self.export()], ["first"])
+
+        with self.assertNumQueries(3):
+            # сессия, пользователь и владелец - без запроса заказов
+            self.export()
+
+        order.delivery_address = "changed"
+        order.save()
+        self.assertEqual([o["delivery_address"] for o in self.export()], ["changed"])
+
+        other = User.objects.create_user(username="cache-other")
+        order.user = other
+        order.save()
+        self.assertEqual(self.export(), [])
+
+    def test_m2m_change_invalidates_export(self):
+        order = Order.objects.create(user=self.owner, delivery_address="m2m")
+        version = get_user_orders_version(self.owner.pk)
+        Product.objects.get(pk=1).orders.add(order)
+        self.assertNotEqual(get_user_orders_version(self.owner.pk), version)
+
+    @override_settings(CACHES={
+        "default": {
+            "BACKEND": "mysite.cache.TieredCache",
+            "LOCATION": "shared",
+            "OPTIONS": {"GENERATION_CHECK_INTERVAL": 60},
+        },
+        "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "ratelimit": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    })
+    def test_version_bump_is_seen_by_other_workers_at_once(self):
+        other_worker = caches.create_connection("default")
+        with mock.patch("shopapp.cache.cache", other_worker):
+            version = get_user_orders_version(self.owner.pk)
+        Order.objects.create(user=self.owner, delivery_address="bump")
+        with mock.patch("shopapp.cache.cache", other_worker):
+            self.assertNotEqual(get_user_orders_version(self.owner.pk), version)
+
+
+class ShopQueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'products-fixture.json',
+        'groups-fixture.json',
+        'orders-fixture.json',
+    ]
+    query_budgets = {
+        "shopapp:products_list": 4,
+        ("shopapp:products_details", 1): 5,
+        "shopapp:order_list": 5,
+        ("shopapp:orders_detail", 1): 5,
+        "shopapp:products_export": 4,
+        "shopapp:orders_export": 5,
+        "shopapp:product-list": 4,
+        "shopapp:order-list": 5,
+    }
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username="budget", password="111")
+        self.client.force_login(self.user)
+
+
+class ShopQueryCountTestCase(QueryCountTestMixin, TestCase):
+    query_counts = {
+        "shopapp:index": 0,
+        "shopapp:groups_list": 1,
+        "shopapp:products_list": 3,
+        ("shopapp:products_details", 1): 4,  # + updated_at для условного GET
+        "shopapp:product_create": 2,
+        ("shopapp:products_update", 1): 3,
+        ("shopapp:products_delete", 1): 1,
+        "shopapp:products_export": 2,
+        "shopapp:latest_products_feed": 1,
+        "shopapp:order_list": 4,
+        ("shopapp:orders_detail", 1): 4,
+        "shopapp:order_create": 2,
+        ("shopapp:order_update", 1): 4,
+        ("shopapp:order_delete", 1): 1,
+        "shopapp:orders_export": 5,
+        ("shopapp:user_orders_list", 1): 5,
+        ("shopapp:user_order_explorer", 1): 4,
+        "shopapp:product-list": 3,
+        ("shopapp:product-detail", 1): 4,
+        "shopapp:product-download-csv": 3,
+        "shopapp:order-list": 3,
+        ("shopapp:order-detail", 1): 3,
+    }
+    chunk_query_counts = {
+        "shopapp:products_export": ("products", 1),
+        "shopapp:orders_export": ("orders", 2),
+    }
+
+
+class ProductImageVariantsTestCase(TempMediaRootMixin, TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'groups-fixture.json',
+    ]
+
+    def test_variants_are_built_on_upload(self):
+        product = Product.objects.create(name="with preview", preview=self.make_image())
+        storage = product.preview.storage
+
+        for variant, size in IMAGE_VARIANTS.items():
+            for ext in ("jpg", "webp"):
+                with storage.open(variant_name(product.preview.name, variant, ext)) as file:
+                    self.assertEqual(max(Image.open(file).size), size)
+
+        response = self.client.get(reverse("shopapp:products_list"), HTTP_USER_AGENT="Mozilla/5.0")
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, variant_name(product.preview.name, "thumb", "jpg"))
+
+        response = self.client.get(
+            reverse("shopapp:product-detail", kwargs={"pk": product.pk}),
+            HTTP_USER_AGENT="Mozilla/5.0",
+        )
+        variants = response.json()["preview_variants"]
+        self.assertTrue(variants["thumb_webp"].startswith("http://testserver/"))
+        self.assertIn(" 800w", variants["srcset_webp"])
+
+    def test_backfill_command_builds_missing_variants(self):
+        product = Product.objects.create(name="old preview", preview=self.make_image())
+        storage = product.preview.storage
+        thumb = variant_name(product.preview.name, "thumb", "jpg")
+        storage.delete(thumb)
+
+        call_command("build_image_variants", stdout=StringIO())
+
+        self.assertTrue(storage.exists(thumb))
+
+    def test_lists_do_not_touch_storage(self):
+        product = Product.objects.create(name="with preview", preview=self.make_image())
+        with mock.patch("django.core.files.storage.FileSystemStorage.exists") as exists:
+            response = self.client.get(reverse("shopapp:products_list"), HTTP_USER_AGENT="Mozilla/5.0")
+            self.assertContains(response, variant_name(product.preview.name, "thumb", "webp"))
+            response = self.client.get(reverse("shopapp:product-list"), HTTP_USER_AGENT="Mozilla/5.0")
+            row = next(row for row in response.json()["results"] if row["pk"] == product.pk)
+            self.assertIn("srcset_webp", row["preview_variants"])
+        exists.assert_not_called()
+
+    def test_variants_of_replaced_and_deleted_files_are_removed(self):
+        product = Product.objects.create(name="replaced", preview=self.make_image("first.png"))
+        storage = product.preview.storage
+        first = variant_name(product.preview.name, "thumb", "jpg")
+
+        product = Product.objects.get(pk=product.pk)
+        product.preview = self.make_image("second.png")
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+            self.assertTrue(storage.exists(first))
+        second = variant_name(product.preview.name, "thumb", "jpg")
+        self.assertFalse(storage.exists(first))
+        self.assertTrue(storage.exists(second))
+        self.assertEqual(Product.objects.get(pk=product.pk).preview_variants_for, product.preview.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertFalse(storage.exists(second))
+
+    def test_variants_survive_rolled_back_delete(self):
+        product = Product.objects.create(name="kept", preview=self.make_image("kept.png"))
+        thumb = variant_name(product.preview.name, "thumb", "jpg")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    product.delete()
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertTrue(product.preview.storage.exists(thumb))
+
+
+class ProductGalleryUploadTestCase(TempMediaRootMixin, TestCase):
+    fixtures = [
+        'user-fixture.json',
+        'products-fixture.json',
+        'groups-fixture.json',
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser(username="gallery", password="111"))
+        self.product = Product.objects.get(pk=1)
+        self.url = reverse("shopapp:products_update", kwargs={"pk": self.product.pk})
+
+    def post(self, images):
+        return self.client.post(self.url, {
+            "name": self.product.name,
+            "price": self.product.price,
+            "descriptions": self.product.descriptions,
+            "discount": self.product.discount,
+            "images": images,
+        }, HTTP_USER_AGENT="Mozilla/5.0")
+
+    def test_gallery_is_inserted_with_one_query(self):
+        images = [self.make_image(f"photo{i}.jpg") for i in range(5)]
+        inserts = []
+
+        def record_inserts(execute, sql, params, many, context):
+            if sql.startswith('INSERT INTO "shopapp_productimages"'):
+                inserts.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record_inserts):
+            response = self.post(images)
+
+        self.assertRedirects(response, reverse("shopapp:products_details", kwargs={"pk": self.product.pk}))
+        self.assertEqual(len(inserts), 1)
+        gallery = list(self.product.images.all())
+        self.assertEqual(len(gallery), 5)
+        for item in gallery:
+            self.assertTrue(item.image.storage.exists(variant_name(item.image.name, "thumb", "webp")))
+
+    def test_invalid_file_rejects_whole_upload(self):
+        broken = SimpleUploadedFile("broken.jpg", b"not an image", content_type="image/jpeg")
+        response = self.post([self.make_image("good.jpg"), broken])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "broken.jpg")
+        self.assertFalse(self.product.images.exists())
+        stored = [path for path in Path(self.media_root).rglob("*") if path.is_file()]
+        self.assertEqual(stored, [])
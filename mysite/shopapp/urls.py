@@ -12,7 +12,7 @@ from .views import (ShopIndexView, GroupsListView,
                     OrderDeleteView, OrderDataExportView,
                     ProductViewSet, OrderViewSet,
                     LatestProductsFeed, UserOrdersListView,
-                    UserOrderDataExportView
+                    UserOrderDataExportView, JobStatusView
                     )
 
 app_name = "shopapp"
@@ -41,6 +41,8 @@ urlpatterns = [
     path("orders/<int:pk>/archive", OrderDeleteView.as_view(), name="order_delete"),
 
     path("users/<int:pk>/orders/", UserOrdersListView.as_view(), name="user_orders_list"),
-    path("users/<int:pk>/orders/export/", UserOrderDataExportView.as_view(), name="user_order_explorer")
+    path("users/<int:pk>/orders/export/", UserOrderDataExportView.as_view(), name="user_order_explorer"),
+
+    path("jobs/<int:pk>/", JobStatusView.as_view(), name="job_status"),
 
 ]
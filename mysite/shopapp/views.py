@@ -3,46 +3,77 @@
 
 Разный view для интернет-магазина: по товарам, заказам и т.д.
 """
-from csv import DictWriter
+from collections import defaultdict
 from timeit import default_timer
+import json
 import logging
 
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
 from django.contrib.auth.decorators import permission_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.models import Group, User
-from django.contrib.gis.feeds import Feed
-from django.core.cache import cache
-from django.http import HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, reverse, get_object_or_404
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.context_processors import PermWrapper
-from rest_framework import viewsets
+from rest_framework import viewsets, status
 from rest_framework.parsers import MultiPartParser
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 from rest_framework.request import Request
 from rest_framework.response import Response
 
-from .common import save_csv_produts
+from mysite.cache import aget_or_compute
+from mysite.changes import conditional_on, get_change_stamp, stamp_datetime
+from mysite.feeds import AsyncFeed
+from mysite.values import ValuesListMixin
+
+from .gallery import store_gallery_images, create_gallery
+from .common import iter_csv_rows, iter_keyset_chunks, aiter_keyset_chunks, CSV_EXPORT_CHUNK_SIZE
+from .jobs import enqueue_job, job_status
 from shopapp.forms import ProductForm, OrderForm, GroupForm
-from shopapp.models import Product, Order, ProductImages
+from shopapp.models import Product, ProductImages, Order, Job
+from .cache import get_user_orders_version, aget_user_orders_version, USER_ORDERS_CACHE_TIMEOUT
+from .pagination import ShopCursorPagination
+from .search import FullTextSearchFilter, RankOrderingFilter
 from .serializers import ProductSerializer, OrderSerializer
 
 logger = logging.getLogger(__name__)
 
 
+# страница товара показывает галерею и автора
+PRODUCT_RELATED_MODELS = (ProductImages, User)
+
+
+def product_updated_at(request, pk, **kwargs):
+    try:
+        updated_at = Product.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
+    except (TypeError, ValueError):
+        return None  # pk из роутера DRF не проверен, 404 вернёт сам view
+    if updated_at is None:
+        return None
+    related_stamp = max(get_change_stamp(model) for model in PRODUCT_RELATED_MODELS)
+    return max(updated_at, stamp_datetime(related_stamp))
+
+
 @extend_schema(description="Product views CRUD")
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = ShopCursorPagination
     filter_backends = [
-        SearchFilter,
+        FullTextSearchFilter,
         DjangoFilterBackend,
-        OrderingFilter,
+        RankOrderingFilter,
     ]
     search_fields = [
         'name',
@@ -56,16 +87,15 @@ class ProductViewSet(viewsets.ModelViewSet):
         'archived',
     ]
     ordering_fields = [
+        'pk',
         'name',
         'descriptions',
         'price',
     ]
+    ordering = ['pk']
 
     @action(detail=False, methods=['get'])
     def download_csv(self, request: Request):
-        response = HttpResponse(content_type="text/csv")
-        filename = 'products-export.csv'
-        response["Content-Disposition"] = f"attachment; filename={filename}"
         queryset = self.filter_queryset(self.get_queryset())
         fields = [
             'name',
@@ -73,26 +103,21 @@ class ProductViewSet(viewsets.ModelViewSet):
             'price',
             'discount',
         ]
-        queryset = queryset.only(*fields)
-        writer = DictWriter(response, fieldnames=fields)
-        writer.writeheader()
-
-        for product in queryset:
-            writer.writerow({
-                field: getattr(product, field)
-                for field in fields
-            })
-
+        rows = queryset.values_list(*fields).iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE)
+        response = StreamingHttpResponse(iter_csv_rows(fields, rows), content_type="text/csv")
+        filename = 'products-export.csv'
+        response["Content-Disposition"] = f"attachment; filename={filename}"
         return response
 
-    @action(detail=False, methods=['get'], parser_classes=[MultiPartParser])
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
     def upload_csv(self, request: Request):
-        products = save_csv_produts(
-            request.FILES["file"].file,
+        job = enqueue_job(
+            Job.Kind.IMPORT_PRODUCTS,
+            source=request.FILES["file"],
             encoding=request.encoding,
+            user=request.user,
         )
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        return Response(job_status(job), status=status.HTTP_202_ACCEPTED)
 
     @extend_schema(
         summary="Get one product by ID",
@@ -102,11 +127,13 @@ class ProductViewSet(viewsets.ModelViewSet):
             404: OpenApiResponse(description="Empty response, product by id not found")
         }
     )
+    @method_decorator(conditional_on(product_updated_at))
     def retrieve(self, *args, **kwargs):
         return super().retrieve(*args, **kwargs)
 
 
-class LatestProductsFeed(Feed):
+class LatestProductsFeed(AsyncFeed):
+    changes_model = Product
     title = "Shop product (latest)"
     description = "Updates on changes in shop products."
     link = reverse_lazy('shopapp:products_list')
@@ -126,13 +153,14 @@ class LatestProductsFeed(Feed):
 
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    pagination_class = ShopCursorPagination
     filter_backends = [
-        SearchFilter,
+        FullTextSearchFilter,
         DjangoFilterBackend,
-        OrderingFilter,
+        RankOrderingFilter,
     ]
     search_fields = [
         'delivery_address',
@@ -148,6 +176,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         "delivery_address",
         "user_id",
     ]
+    ordering = ["pk"]
 
 
 class ShopIndexView(View):
@@ -182,6 +211,7 @@ class GroupsListView(View):
         return redirect(request.path)
 
 
+@method_decorator(conditional_on(product_updated_at), name="dispatch")
 class ProductsDetailsView(DetailView):
     template_name = "shopapp/products-details.html"
     #model = Product
@@ -227,12 +257,13 @@ class ProductsUpdateView(UserPassesTestMixin, UpdateView):
                        )
 
     def form_valid(self, form):
+        try:
+            names = store_gallery_images(self.object, form.files.getlist("images"))
+        except ValidationError as error:
+            form.add_error("images", error)
+            return self.form_invalid(form)
         response = super().form_valid(form)
-        for image in form.files.getlist("images"):
-            ProductImages.objects.create(
-                product=self.object,
-                image=image,
-            )
+        create_gallery(self.object, names)
         return response
 
 
@@ -307,47 +338,121 @@ def create_order(request: HttpRequest) -> HttpResponse:
     return render(request, 'shopapp/create-order.html', context=context)
 
 
-class ProductDataExportView(View):
-    def get(self, request: HttpRequest) -> JsonResponse:
-        products = Product.objects.order_by("pk").all()
-
-        products_data = [
-            {
-                "pk": product.pk,
-                "name": product.name,
-                "price": product.price,
-                "archived": product.archived,
-
-            }
-            for product in products
-        ]
-        elem = products_data[0]
-        name = elem["name"]
-        print("name", name)
-        return JsonResponse({"products": products_data})
+def iter_products_export_json(since_pk=None):
+    """
+    Отдаёт {"products": [...], "last_pk": ...} по частям, не собирая
+    весь каталог в памяти. last_pk можно передать в ?since_pk=,
+    чтобы продолжить выгрузку с того же места.
+    """
+    encoder = DjangoJSONEncoder()
+    products = Product.objects.values("pk", "name", "price", "archived")
+    last_pk = since_pk
+    separator = ""
+    yield '{"products": ['
+    for chunk in iter_keyset_chunks(products, since_pk=since_pk):
+        for product in chunk:
+            yield separator + encoder.encode(product)
+            separator = ", "
+        last_pk = chunk[-1]["pk"]
+    yield '], "last_pk": ' + encoder.encode(last_pk) + "}"
+
+
+async def aiter_products_export_json(since_pk=None):
+    encoder = DjangoJSONEncoder()
+    products = Product.objects.values("pk", "name", "price", "archived")
+    last_pk = since_pk
+    separator = ""
+    yield '{"products": ['
+    async for chunk in aiter_keyset_chunks(products, since_pk=since_pk):
+        for product in chunk:
+            yield separator + encoder.encode(product)
+            separator = ", "
+        last_pk = chunk[-1]["pk"]
+    yield '], "last_pk": ' + encoder.encode(last_pk) + "}"
+
+
+async def arequest_user(request: HttpRequest):
+    # request.user ленивый и в async-коде без потока не загрузится
+    return await sync_to_async(get_user)(request)
 
 
-class OrderDataExportView(UserPassesTestMixin, View):
+class ProductDataExportView(View):
+    """
+    Под ASGI выгрузка идёт через асинхронный ORM и не занимает поток
+    на время ожидания БД и медленного клиента. Под WSGI асинхронный
+    генератор был бы собран целиком в памяти, поэтому там остаётся
+    синхронный.
+    """
+
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        since_pk = request.GET.get("since_pk")
+        if since_pk is not None:
+            if not since_pk.isdigit():
+                return JsonResponse({"detail": "since_pk must be a positive integer"}, status=400)
+            since_pk = int(since_pk)
+        if isinstance(request, ASGIRequest):
+            content = aiter_products_export_json(since_pk)
+        else:
+            content = iter_products_export_json(since_pk)
+        return StreamingHttpResponse(content, content_type="application/json")
+
+
+def iter_orders_export():
+    """
+    Заказы с товарами: на каждый кусок заказов один запрос к заказам
+    и один к связующей таблице (с JOIN на названия товаров).
+    """
+    orders = Order.objects.values("pk", "delivery_address", "promocode", "user_id")
+    for chunk in iter_keyset_chunks(orders):
+        products = defaultdict(list)
+        for order_id, product_id, name in order_products_links(chunk):
+            products[order_id].append({"pk": product_id, "name": name})
+        for order in chunk:
+            order["products"] = products[order["pk"]]
+            yield order
+
+
+async def aiter_orders_export():
+    orders = Order.objects.values("pk", "delivery_address", "promocode", "user_id")
+    async for chunk in aiter_keyset_chunks(orders):
+        products = defaultdict(list)
+        async for order_id, product_id, name in order_products_links(chunk):
+            products[order_id].append({"pk": product_id, "name": name})
+        for order in chunk:
+            order["products"] = products[order["pk"]]
+            yield order
+
+
+def order_products_links(orders):
+    return (
+        Order.products.through.objects
+        .filter(order_id__in=[order["pk"] for order in orders])
+        .order_by("order_id", "product_id")
+        .values_list("order_id", "product_id", "product__name")
+    )
 
-    def test_func(self):
-        return self.request.user.is_staff
 
-    def get(self, request: HttpRequest) -> JsonResponse:
+class OrderDataExportView(View):
+    """
+    Только для staff. Проверка сделана в get(), а не через
+    UserPassesTestMixin: миксины auth обращаются к request.user синхронно.
+    """
 
-        orders = Order.objects.order_by('pk').all()
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        user = await arequest_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        if not user.is_staff:
+            raise PermissionDenied
 
-        orders_data = [
-            {
-                "pk": order.pk,
-                "delivery_address": order.delivery_address,
-                "promocode": order.promocode,
-                "user_id": order.user_id,
-                "products": str(order.products.values_list("name"))
+        if request.GET.get("format") == "ndjson":
+            if isinstance(request, ASGIRequest):
+                lines = (json.dumps(order) + "\n" async for order in aiter_orders_export())
+            else:
+                lines = (json.dumps(order) + "\n" for order in iter_orders_export())
+            return StreamingHttpResponse(lines, content_type="application/x-ndjson")
 
-            }
-            for order in orders
-        ]
-        return JsonResponse({"orders": orders_data})
+        return JsonResponse({"orders": [order async for order in aiter_orders_export()]})
 
 
 class UserOrdersListView(LoginRequiredMixin, ListView):
@@ -358,7 +463,9 @@ class UserOrdersListView(LoginRequiredMixin, ListView):
         orders = Order.objects.filter(user=owner).all()
         context = {
             "user": owner,
-            "orders": orders
+            "orders": orders,
+            "orders_version": get_user_orders_version(owner.pk),
+            "cache_timeout": USER_ORDERS_CACHE_TIMEOUT,
         }
         print(context)
         return context
@@ -368,20 +475,38 @@ class UserOrdersListView(LoginRequiredMixin, ListView):
         return context
 
 
-class UserOrderDataExportView(LoginRequiredMixin, View):
-    def get(self, request: HttpRequest, **kwargs) -> JsonResponse:
-        owner = get_object_or_404(User, pk=self.kwargs.get("pk"))
-        cache_key = f"user_order-data-export-{owner}"
-        orders_data = cache.get(cache_key)
-        if orders_data is None:
-            orders = Order.objects.filter(user=owner).all()
-            orders_data = [
-                {
-                    "pk": order.pk,
-                    "delivery_address": order.delivery_address,
-                    "promocode": order.promocode,
-                }
-                for order in orders
-            ]
-            cache.set(cache_key, orders_data, 300)
+async def auser_orders_data(owner: User) -> list:
+    return [
+        {
+            "pk": order.pk,
+            "delivery_address": order.delivery_address,
+            "promocode": order.promocode,
+        }
+        async for order in Order.objects.filter(user=owner)
+    ]
+
+
+class UserOrderDataExportView(View):
+    async def get(self, request: HttpRequest, **kwargs) -> JsonResponse:
+        user = await arequest_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        try:
+            owner = await User.objects.aget(pk=self.kwargs.get("pk"))
+        except User.DoesNotExist:
+            raise Http404("No User matches the given query.")
+        orders_data = await aget_or_compute(
+            f"user_order-data-export-{owner.pk}",
+            lambda: auser_orders_data(owner),
+            USER_ORDERS_CACHE_TIMEOUT,
+            version=await aget_user_orders_version(owner.pk),
+        )
         return JsonResponse({str(owner): orders_data})
+
+
+class JobStatusView(LoginRequiredMixin, View):
+    def get(self, request: HttpRequest, pk: int) -> JsonResponse:
+        job = get_object_or_404(Job, pk=pk)
+        if not (request.user.is_staff or job.created_by_id == request.user.pk):
+            return JsonResponse({"detail": "Forbidden"}, status=403)
+        return JsonResponse(job_status(job))